@@ -0,0 +1,429 @@
+"""
+benchmark.py
+Offline benchmark for the Tembo AI request path.
+
+Groq and Cohere are replaced by in-process stubs with a configurable latency,
+so runs are reproducible, free and not subject to API rate limits. Postgres +
+pgvector is real (whatever DB_* in .env points at — use a local database).
+
+The workload is replayed from sample_requests.json ("chat_examples") at each
+requested concurrency level, and p50/p95/p99 latency plus requests/sec are
+reported per pipeline stage (the stage timers from metrics.py).
+
+Usage:
+  python benchmark.py --seed                          # load the KB with stub embeddings (local DB only)
+  python benchmark.py                                 # async pipeline at concurrency 1, 8, 32
+  python benchmark.py --mode sync --concurrency 1 4 16 --requests 300
+  python benchmark.py --mode search --json bench.json # retrieval only, results saved for comparison
+  EMBEDDING_BACKEND=local python benchmark.py --seed   # in-process embedder instead of the Cohere stub
+  python benchmark.py --storage-report                # index size + recall@k per VECTOR_STORAGE mode
+
+Modes:
+  async   rag_answer_async (what /chat runs)
+  stream  rag_answer_stream (what /chat/stream runs), consumed to the end
+  sync    rag_answer in a thread pool
+  search  similarity_search only, in a thread pool
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import types
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+# The stubs stand in for both APIs, so real keys are not needed
+os.environ.setdefault("COHERE_API_KEY", "benchmark-stub")
+os.environ.setdefault("GROQ_API_KEY", "benchmark-stub")
+
+import metrics
+import rag
+import vector_store
+from embeddings import CohereEmbeddings, embedder, query_cache
+from vector_store import (
+    close_async_pool, history_writer, open_async_pool, pool, similarity_search, sync_documents,
+)
+
+SESSION_PREFIX = "bench-"
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+
+# ── Stubs ───────────────────────────────────────────────────────────────────────
+
+def stub_vector(text: str, dimension: int = 384) -> List[float]:
+    """
+    Deterministic bag-of-words embedding: each word hashes to a fixed random
+    direction, so questions sharing words land near each other and searches
+    return plausible neighbours.
+    """
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in text.lower().split():
+        rng = np.random.default_rng(zlib.crc32(word.strip(".,?!:;()").encode()))
+        vector += rng.standard_normal(dimension, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def install_stubs(embed_latency: float, llm_latency: float, completion_tokens: int):
+    """
+    Swap the Groq clients and, with the Cohere backend, its HTTP calls for
+    latency-only stubs (EMBEDDING_BACKEND=local is measured for real).
+
+    The query cache stops persisting to EMBED_CACHE_PATH, and stubbed vectors
+    carry their own model name, so neither the app's cache file nor
+    sync_documents ever mistakes them for real Cohere embeddings.
+    """
+    query_cache.path = None
+    query_cache.clear()
+
+    def post(texts, input_type, timeout=None):
+        time.sleep(embed_latency)
+        return [stub_vector(t) for t in texts]
+
+    async def post_async(texts, input_type):
+        await asyncio.sleep(embed_latency)
+        return [stub_vector(t) for t in texts]
+
+    if isinstance(embedder, CohereEmbeddings):
+        embedder._post = post
+        embedder._post_async = post_async
+        embedder.model = "benchmark-stub"
+
+    answer = " ".join(["Karibu!"] * completion_tokens)
+
+    def usage(messages):
+        prompt_chars = sum(len(m["content"]) for m in messages)
+        return types.SimpleNamespace(prompt_tokens=prompt_chars // 4, completion_tokens=completion_tokens)
+
+    def completion(messages):
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=answer))],
+            usage=usage(messages),
+        )
+
+    def create(**kwargs):
+        time.sleep(llm_latency)
+        return completion(kwargs["messages"])
+
+    async def stream(messages):
+        # Spread the latency over the tokens, Groq-style usage on the last chunk
+        for i in range(completion_tokens):
+            await asyncio.sleep(llm_latency / completion_tokens)
+            last = i == completion_tokens - 1
+            yield types.SimpleNamespace(
+                choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content="Karibu! "))],
+                usage=None,
+                x_groq=types.SimpleNamespace(usage=usage(messages)) if last else None,
+            )
+
+    async def create_async(**kwargs):
+        if kwargs.get("stream"):
+            return stream(kwargs["messages"])
+        await asyncio.sleep(llm_latency)
+        return completion(kwargs["messages"])
+
+    def client(create_fn):
+        return types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create_fn)))
+
+    rag.client = client(create)
+    rag.async_client = client(create_async)
+
+
+# ── Workload ────────────────────────────────────────────────────────────────────
+
+def load_workload(path: str, requests: int, unique: bool) -> List[dict]:
+    """Cycle the sample chat requests up to `requests` entries."""
+    with open(path, "r", encoding="utf-8") as f:
+        examples = [e["request"] for e in json.load(f)["chat_examples"]]
+
+    workload = []
+    for i in range(requests):
+        request = dict(examples[i % len(examples)])
+        if unique:
+            # Defeat the embedding and answer caches: every question is new
+            request["message"] = f"{request['message']} (variant {i})"
+        request["session_id"] = SESSION_PREFIX + (request.get("session_id") or "default")
+        workload.append(request)
+    return workload
+
+
+class StageRecorder:
+    """metrics.py observer collecting raw timings per stage."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def __call__(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds)
+
+
+def summarize(samples: Dict[str, List[float]], wall_seconds: float) -> Dict[str, dict]:
+    order = ["request", *metrics.STAGES]
+    summary = {}
+    for stage in sorted(samples, key=lambda s: order.index(s) if s in order else len(order)):
+        ms = np.asarray(samples[stage]) * 1000
+        summary[stage] = {
+            "count": int(ms.size),
+            "p50_ms": round(float(np.percentile(ms, 50)), 2),
+            "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2),
+            "rps":    round(ms.size / wall_seconds, 1) if wall_seconds else 0.0,
+        }
+    return summary
+
+
+# ── Runners ─────────────────────────────────────────────────────────────────────
+
+def chat_kwargs(request: dict, use_cache: bool) -> dict:
+    return {
+        "question":        request["message"],
+        "session_id":      request["session_id"],
+        "category_filter": request.get("category_filter"),
+        "use_cache":       use_cache,
+    }
+
+
+async def run_async(workload: List[dict], concurrency: int, mode: str, use_cache: bool) -> int:
+    """Replay `workload` with `concurrency` workers; returns the number of failures."""
+    await open_async_pool()
+    pending = iter(workload)
+    failures = 0
+
+    async def one(request: dict):
+        if mode == "stream":
+            async for _ in rag.rag_answer_stream(**chat_kwargs(request, use_cache)):
+                pass
+        else:
+            await rag.rag_answer_async(**chat_kwargs(request, use_cache))
+
+    async def worker():
+        nonlocal failures
+        for request in pending:
+            try:
+                await one(request)
+            except Exception as e:
+                failures += 1
+                print(f"  request failed: {e}")
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        # The pool is bound to this event loop; the next asyncio.run() builds a new one
+        await close_async_pool()
+    return failures
+
+
+def run_threads(workload: List[dict], concurrency: int, mode: str, use_cache: bool, recorder: StageRecorder) -> int:
+    def search_one(request: dict):
+        vector = stub_vector(request["message"])
+        start = time.perf_counter()
+        similarity_search(
+            query=request["message"],
+            category_filter=request.get("category_filter"),
+            query_vector=vector,
+        )
+        elapsed = time.perf_counter() - start
+        recorder("search", elapsed)
+        recorder("request", elapsed)
+
+    def one(request: dict) -> bool:
+        try:
+            if mode == "search":
+                search_one(request)
+            else:
+                rag.rag_answer(**chat_kwargs(request, use_cache))
+            return True
+        except Exception as e:
+            print(f"  request failed: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return sum(not ok for ok in executor.map(one, workload))
+
+
+def run_level(workload: List[dict], concurrency: int, args) -> dict:
+    """Warm up, then measure one concurrency level."""
+    def run(requests: List[dict], recorder: StageRecorder) -> int:
+        if args.mode in ("async", "stream"):
+            return asyncio.run(run_async(requests, concurrency, args.mode, args.cache))
+        return run_threads(requests, concurrency, args.mode, args.cache, recorder)
+
+    run(workload[:args.warmup], StageRecorder())
+
+    recorder = StageRecorder()
+    metrics.add_observer(recorder)
+    try:
+        start = time.perf_counter()
+        failures = run(workload, recorder)
+        wall = time.perf_counter() - start
+    finally:
+        metrics.remove_observer(recorder)
+
+    return {
+        "concurrency":  concurrency,
+        "requests":     len(workload),
+        "failures":     failures,
+        "wall_seconds": round(wall, 3),
+        "rps":          round(len(workload) / wall, 1) if wall else 0.0,
+        "stages":       summarize(recorder.samples, wall),
+    }
+
+
+def print_level(result: dict):
+    print(
+        f"\nconcurrency={result['concurrency']}  requests={result['requests']}  "
+        f"failures={result['failures']}  wall={result['wall_seconds']}s  rps={result['rps']}"
+    )
+    print(f"  {'stage':<10}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>9}")
+    for stage, s in result["stages"].items():
+        print(f"  {stage:<10}{s['count']:>7}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}{s['rps']:>9}")
+
+
+# ── Setup / cleanup ─────────────────────────────────────────────────────────────
+
+def is_local_database() -> bool:
+    """True if vector_store connects to this machine (DATABASE_URL or DB_HOST, whichever it uses)."""
+    host = vector_store.DB_CONFIG.get("host") or "localhost"
+    return host in LOCAL_HOSTS or host.startswith("/")
+
+
+def seed():
+    """Sync the Kenya knowledge base using stub embeddings."""
+    from massive_kenya_data import MASSIVE_KENYA_DATA
+
+    if not is_local_database():
+        raise SystemExit(f"Refusing to seed stub embeddings into a non-local database ({vector_store.DB_CONFIG.get('host')}).")
+    print(f"Seeding {len(MASSIVE_KENYA_DATA)} documents with stub embeddings...")
+    print(sync_documents(MASSIVE_KENYA_DATA))
+
+
+def storage_report(workload_path: str, top_k: int = 5) -> dict:
+    """
+    Index size, recall@k and latency of each VECTOR_STORAGE mode, against
+    exact (brute-force) search over the same rows. Missing indexes are built
+    (local DB only) and left in place.
+    """
+    if not is_local_database():
+        raise SystemExit(
+            f"Refusing to build benchmark indexes in a non-local database ({vector_store.DB_CONFIG.get('host')})."
+        )
+    vector_store.migrate_schema()
+    vector_store.memory_index.refresh(True)
+
+    with open(workload_path, "r", encoding="utf-8") as f:
+        questions = [e["request"]["message"] for e in json.load(f)["chat_examples"]]
+    # Plus one query per destination/category pair in the KB, for a steadier recall figure
+    snapshot = vector_store.memory_index._snapshot
+    questions += [f"{d} {c}" for d, c in zip(snapshot["destination"], snapshot["category"])]
+    questions = list(dict.fromkeys(questions))
+    vectors = [embedder.embed_query(q) for q in questions]
+    exact = [{r["content"] for r in vector_store.memory_index.search(v, top_k)} for v in vectors]
+
+    report = {}
+    for storage in vector_store.VECTOR_INDEXES:
+        if storage != "full" and vector_store._pgvector_version < vector_store.QUANTIZED_MIN_PGVECTOR:
+            report[storage] = {"supported": False}
+            continue
+        vector_store.migrate_vector_storage(storage)
+        recalls, latencies = [], []
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                for vector, expected in zip(vectors, exact):
+                    sql, params = vector_store._search_sql(vector, top_k, storage=storage)
+                    start = time.perf_counter()
+                    cur.execute(sql, params)
+                    rows = cur.fetchall()
+                    latencies.append(time.perf_counter() - start)
+                    recalls.append(len({row[0] for row in rows} & expected) / max(len(expected), 1))
+        report[storage] = {
+            "supported":  True,
+            "recall":     round(float(np.mean(recalls)), 4),
+            "p50_ms":     round(float(np.percentile(latencies, 50)) * 1000, 2),
+            "p95_ms":     round(float(np.percentile(latencies, 95)) * 1000, 2),
+        }
+    for storage, size in vector_store.vector_index_sizes().items():
+        report[storage]["index_kb"] = round(size / 1024, 1)
+
+    print(f"\nVector storage (top_k={top_k}, {len(questions)} queries, overfetch x{vector_store.VECTOR_OVERFETCH})")
+    print(f"  {'storage':<9} {'index KB':>9} {'recall':>7} {'p50 ms':>7} {'p95 ms':>7}")
+    for storage, r in report.items():
+        if not r["supported"]:
+            version = ".".join(map(str, vector_store._pgvector_version))
+            print(f"  {storage:<9} needs pgvector >= 0.7.0 (server has {version})")
+        else:
+            print(f"  {storage:<9} {r.get('index_kb', 0):>9} {r['recall']:>7} {r['p50_ms']:>7} {r['p95_ms']:>7}")
+    return report
+
+
+def cleanup_sessions():
+    history_writer.flush(timeout=30)   # write-behind rows must land before they can be deleted
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM chat_sessions WHERE session_id LIKE %s", (SESSION_PREFIX + "%",))
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the Tembo AI request path")
+    parser.add_argument("--mode", choices=["async", "stream", "sync", "search"], default="async")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each level")
+    parser.add_argument("--workload", default="sample_requests.json")
+    parser.add_argument("--embed-latency-ms", type=float, default=60.0, help="stub Cohere latency")
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0, help="stub Groq latency")
+    parser.add_argument("--completion-tokens", type=int, default=40)
+    parser.add_argument("--unique", action="store_true", help="make every question unique (no cache hits)")
+    parser.add_argument("--cache", action="store_true", help="allow answer-cache hits")
+    parser.add_argument("--seed", action="store_true", help="load the knowledge base with stub embeddings first")
+    parser.add_argument("--storage-report", action="store_true",
+                        help="report index size and recall per vector storage mode, then exit")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if not metrics.METRICS_ENABLED:
+        raise SystemExit("METRICS_ENABLED=false disables the stage timers the benchmark reads.")
+
+    install_stubs(args.embed_latency_ms / 1000, args.llm_latency_ms / 1000, max(args.completion_tokens, 1))
+    if args.seed:
+        seed()
+    if args.storage_report:
+        report = storage_report(args.workload)
+        pool.close()
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"mode": "storage", "results": report}, f, indent=2)
+        return
+
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            query_cache.clear()
+            rag.answer_cache.clear()
+            workload = load_workload(args.workload, args.requests, args.unique)
+            result = run_level(workload, concurrency, args)
+            print_level(result)
+            results.append(result)
+    finally:
+        cleanup_sessions()
+        pool.close()
+
+    if args.json:
+        report = {
+            "mode":     args.mode,
+            "settings": {k: v for k, v in vars(args).items() if k not in ("json", "seed")},
+            "results":  results,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
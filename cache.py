@@ -0,0 +1,408 @@
+"""
+cache.py
+In-process caches for Tembo AI.
+
+LRUCache      — thread-safe, size-bounded LRU with optional TTL and optional
+                on-disk persistence (JSON, written atomically, periodically and
+                at exit) so it survives restarts.
+SemanticCache — answers keyed by query embedding, matched by cosine similarity.
+SessionHistoryCache — last N chat messages per session (ring buffers, LRU over sessions).
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Hashable, List, Optional
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    Size-bounded LRU cache with optional per-entry TTL.
+
+    - `maxsize`: least recently used entries are evicted beyond this
+    - `ttl`: seconds an entry stays valid (None = never expires)
+    - `path`: JSON file to load on start and write on save() (keys must be strings)
+    - `save_interval`: with `path`, seconds between background saves; a
+      final save also runs at exit (atexit never runs on SIGKILL, so the
+      periodic save bounds what a killed process loses)
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        path: Optional[str] = None,
+        save_interval: Optional[float] = None,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()   # key -> (value, stored_at)
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._dirty = False
+        self._stop = threading.Event()
+        self._saver: Optional[threading.Thread] = None
+
+        if path:
+            self.load()
+            if save_interval:
+                self._saver = threading.Thread(
+                    target=self._autosave, args=(save_interval,), name="lru-cache-save", daemon=True,
+                )
+                self._saver.start()
+            atexit.register(self.close)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value (refreshing its recency) or None on a miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self._expired(entry[1]):
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size":      len(self._data),
+                "maxsize":   self.maxsize,
+                "hits":      self._hits,
+                "misses":    self._misses,
+                "hit_rate":  round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+            }
+
+    # ── Persistence ─────────────────────────────────────────────────────────────
+
+    def load(self):
+        """
+        Load unexpired entries from `path`, oldest first so LRU order is kept.
+        An unreadable file is ignored and malformed entries are skipped.
+        """
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable cache file {self.path}: {e}")
+            return
+        if not isinstance(entries, list):
+            print(f"Ignoring cache file {self.path}: expected a list of entries")
+            return
+
+        skipped = 0
+        with self._lock:
+            for entry in entries[-self.maxsize:]:
+                try:
+                    key, value, stored_at = entry
+                    if self._expired(float(stored_at)):
+                        continue
+                    self._data[key] = (value, float(stored_at))
+                except (TypeError, ValueError):
+                    skipped += 1
+        if skipped:
+            print(f"Skipped {skipped} malformed entries in cache file {self.path}")
+
+    def save(self):
+        """Write entries to `path` (temp file + rename, so a crash never leaves it half-written)."""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = [[k, v, t] for k, (v, t) in self._data.items() if not self._expired(t)]
+            self._dirty = False
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Per-process temp file: several workers may share `path`
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not save cache file {self.path}: {e}")
+            with self._lock:
+                self._dirty = True
+
+    def close(self):
+        """Stop the background saver and save once more."""
+        self._stop.set()
+        if self._saver is not None:
+            self._saver.join(timeout=5)
+        self.save()
+
+    def _autosave(self, interval: float):
+        while not self._stop.wait(interval):
+            self.save()
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by query embedding.
+
+    A lookup hits when a stored query in the same `namespace` (e.g. category
+    filter) has cosine similarity >= `threshold` with the new query, so
+    paraphrases share one answer. Vectors live in a preallocated float32
+    matrix, so a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, maxsize: int = 500, threshold: float = 0.95, ttl: Optional[float] = None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._vectors = None                      # (maxsize, dim) float32, allocated on first store
+        self._namespace_ids = np.full(maxsize, -1, dtype=np.int64)   # -1 = free slot
+        self._namespaces = {}                     # namespace -> small int id (only live ones kept)
+        self._next_namespace_id = 0
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()   # slot -> (value, stored_at), LRU order
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def lookup(self, vector, namespace: Hashable = None) -> Optional[Any]:
+        """Return the value stored for the most similar cached query, or None."""
+        query = self._normalize(vector)
+        with self._lock:
+            ns_id = self._namespaces.get(namespace)
+            if self._vectors is None or ns_id is None or query.shape[0] != self._vectors.shape[1]:
+                self._misses += 1
+                return None
+
+            sims = self._vectors @ query
+            sims[self._namespace_ids != ns_id] = -np.inf
+            slot = int(np.argmax(sims))
+            if sims[slot] < self.threshold:
+                self._misses += 1
+                return None
+
+            value, stored_at = self._entries[slot]
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                self._free(slot)
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(slot)
+            self._hits += 1
+            return value
+
+    def store(self, vector, value: Any, namespace: Hashable = None):
+        query = self._normalize(vector)
+        with self._lock:
+            if self._vectors is None or query.shape[0] != self._vectors.shape[1]:
+                self._vectors = np.zeros((self.maxsize, query.shape[0]), dtype=np.float32)
+                self._namespace_ids[:] = -1
+                self._entries.clear()
+
+            ns_id = self._namespace_id(namespace)
+            sims = self._vectors @ query
+            sims[self._namespace_ids != ns_id] = -np.inf
+            free = np.flatnonzero(self._namespace_ids == -1)
+            if sims.max() >= self.threshold:
+                slot = int(np.argmax(sims))   # refresh the paraphrase already cached
+                self._entries.pop(slot)
+            elif free.size:
+                slot = int(free[0])
+            else:
+                slot = next(iter(self._entries))   # least recently used
+                self._free(slot)
+                self._evictions += 1
+
+            self._vectors[slot] = query
+            self._namespace_ids[slot] = ns_id
+            self._entries[slot] = (value, time.time())
+
+    def clear(self):
+        with self._lock:
+            self._namespace_ids[:] = -1
+            self._entries.clear()
+            self._namespaces.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size":      len(self._entries),
+                "maxsize":   self.maxsize,
+                "threshold": self.threshold,
+                "hits":      self._hits,
+                "misses":    self._misses,
+                "hit_rate":  round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+            }
+
+    def _free(self, slot: int):
+        self._namespace_ids[slot] = -1
+        self._entries.pop(slot, None)
+
+    def _namespace_id(self, namespace: Hashable) -> int:
+        # Called with the lock held. Namespaces come from request parameters,
+        # so ids no slot uses any more are dropped before the map outgrows maxsize.
+        ns_id = self._namespaces.get(namespace)
+        if ns_id is None:
+            if len(self._namespaces) >= self.maxsize:
+                live = set(self._namespace_ids.tolist())
+                self._namespaces = {ns: i for ns, i in self._namespaces.items() if i in live}
+            ns_id = self._namespaces[namespace] = self._next_namespace_id
+            self._next_namespace_id += 1
+        return ns_id
+
+    @staticmethod
+    def _normalize(vector) -> "np.ndarray":
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+
+class SessionHistoryCache:
+    """
+    Recent chat messages per session, so follow-up turns skip the history query.
+
+    Each session keeps a ring buffer of its last `capacity` messages; at most
+    `max_sessions` sessions are held, least recently used evicted first. A
+    session enters the cache only via load() with its full recent history, so
+    append() ignores sessions that are not cached (their next read loads them).
+    `ttl` bounds how long a loaded session is trusted without re-reading the DB.
+    """
+
+    def __init__(self, max_sessions: int = 1000, capacity: int = 20, ttl: Optional[float] = None):
+        if max_sessions < 1 or capacity < 1:
+            raise ValueError("max_sessions and capacity must be at least 1")
+        self.max_sessions = max_sessions
+        self.capacity = capacity
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()   # session_id -> (deque, loaded_at)
+        # Bumped whenever an appended message may be missing from a later
+        # database read: appends to uncached sessions, and sessions dropped
+        # (evicted, expired, invalidated) after appends. See begin_load().
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, session_id: str, limit: int) -> Optional[List[dict]]:
+        """Last `limit` messages (oldest first), or None if the DB must be read."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and self.ttl is not None and time.time() - entry[1] > self.ttl:
+                del self._sessions[session_id]
+                self._generation += 1
+                entry = None
+            if entry is None or limit > self.capacity:
+                self._misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self._hits += 1
+            messages = list(entry[0])[-limit:] if limit > 0 else []
+            return [dict(m) for m in messages]
+
+    def begin_load(self) -> int:
+        """Token to pass to load(); take it before querying the database."""
+        with self._lock:
+            return self._generation
+
+    def load(self, session_id: str, messages: List[dict], token: int):
+        """
+        Cache a session's history as read from the database (oldest first).
+
+        Skipped if the session is already cached (a concurrent request loaded
+        it first, and its appends since are only in that entry), or if the
+        generation moved since begin_load(), as a message appended meanwhile
+        may be missing from `messages`.
+        """
+        with self._lock:
+            if token != self._generation or session_id in self._sessions:
+                return
+            ring = deque(
+                ({"role": m["role"], "content": m["content"]} for m in messages),
+                maxlen=self.capacity,
+            )
+            self._sessions[session_id] = (ring, time.time())
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evictions += 1
+                self._generation += 1
+
+    def append(self, session_id: str, role: str, content: str):
+        """Write-through for a saved message."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                self._generation += 1
+                return
+            entry[0].append({"role": role, "content": content})
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self._generation += 1
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "sessions":     len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "capacity":     self.capacity,
+                "hits":         self._hits,
+                "misses":       self._misses,
+                "hit_rate":     round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions":    self._evictions,
+            }
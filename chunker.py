@@ -0,0 +1,152 @@
+"""
+chunker.py
+Streaming, sentence-aware chunking of scraped pages for Tembo AI.
+
+Pages are split into overlapping chunks of about CHUNK_TOKENS estimated
+tokens, cut at sentence boundaries (a sentence longer than a whole chunk is
+cut at word boundaries, and a word longer than that — a URL, base64 data —
+at character boundaries). Consecutive chunks share up to CHUNK_OVERLAP_TOKENS
+of trailing sentences, so a fact straddling a boundary is still retrievable.
+
+Everything is a generator: chunk_documents() pulls one page at a time and
+batched() hands ingestion fixed-size lists, so memory stays bounded by one
+page plus one batch however many pages are scraped.
+
+    for batch in batched(chunk_documents(pages), CHUNK_BATCH_SIZE):
+        add_documents_simple([c["content"] for c in batch], batch)
+"""
+
+import os
+import re
+from collections import deque
+from typing import Iterable, Iterator, List
+
+from dotenv import load_dotenv
+
+from prompt_builder import estimate_tokens
+
+load_dotenv()
+
+CHUNK_TOKENS         = int(os.getenv("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+CHUNK_BATCH_SIZE     = int(os.getenv("CHUNK_BATCH_SIZE", "192"))   # two Cohere calls per batch
+
+# Metadata copied from a page onto each of its chunks
+METADATA_FIELDS = ("source", "category", "region", "destination")
+
+# Sentence end: . ! or ? (plus closing quotes/brackets), whitespace, then an
+# uppercase letter, digit or opening quote/bracket
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+(?=[A-Z0-9\"'(\[])")
+
+# A period after these does not end a sentence
+_ABBREVIATIONS = {"mt", "st", "dr", "mr", "mrs", "ms", "no", "approx", "e.g", "i.e", "etc", "vs", "ksh"}
+
+
+def iter_sentences(text: str) -> Iterator[str]:
+    """Yield the sentences of `text` lazily, whitespace-normalized."""
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        if text[match.start()] == ".":
+            word = text[start:match.start()].rsplit(None, 1)
+            if word and word[-1].lower().lstrip("(\"'") in _ABBREVIATIONS:
+                continue
+        sentence = " ".join(text[start:match.end()].split())
+        if sentence:
+            yield sentence
+        start = match.end()
+    sentence = " ".join(text[start:].split())
+    if sentence:
+        yield sentence
+
+
+def _cut_word(word: str, max_tokens: int) -> Iterator[str]:
+    """Cut a word longer than `max_tokens` into the longest prefixes that fit."""
+    while estimate_tokens(word) > max_tokens:
+        # The estimate only grows as the prefix does, so binary search its length
+        lo, hi = 1, len(word)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if estimate_tokens(word[:mid]) <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        yield word[:lo]
+        word = word[lo:]
+    if word:
+        yield word
+
+
+def _split_long(sentence: str, max_tokens: int) -> Iterator[str]:
+    """Cut a sentence longer than `max_tokens` at word (or, if need be, character) boundaries."""
+    words, size = [], 0
+    for word in sentence.split(" "):
+        for part in _cut_word(word, max_tokens):
+            cost = estimate_tokens(part)
+            if words and size + cost > max_tokens:
+                yield " ".join(words)
+                words, size = [], 0
+            words.append(part)
+            size += cost
+    if words:
+        yield " ".join(words)
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[str]:
+    """Yield overlapping chunks of at most about `max_tokens` estimated tokens."""
+    if max_tokens < 1 or not 0 <= overlap_tokens < max_tokens:
+        raise ValueError(f"Invalid sizes: max_tokens={max_tokens}, overlap_tokens={overlap_tokens}")
+
+    window = deque()     # (sentence, tokens) making up the chunk being built
+    size = 0
+    for sentence in iter_sentences(text):
+        pieces = _split_long(sentence, max_tokens) if estimate_tokens(sentence) > max_tokens else (sentence,)
+        for piece in pieces:
+            cost = estimate_tokens(piece)
+            if window and size + cost > max_tokens:
+                yield " ".join(s for s, _ in window)
+                # Carry trailing sentences into the next chunk, leaving room for `piece`
+                kept, kept_size = [], 0
+                for s, c in reversed(window):
+                    if kept_size + c > overlap_tokens or kept_size + c + cost > max_tokens:
+                        break
+                    kept.append((s, c))
+                    kept_size += c
+                window, size = deque(reversed(kept)), kept_size
+            window.append((piece, cost))
+            size += cost
+    # Non-empty here means it holds at least one sentence no chunk has yet
+    if window:
+        yield " ".join(s for s, _ in window)
+
+
+def chunk_documents(
+    pages: Iterable[dict],
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> Iterator[dict]:
+    """
+    Chunk each page dict ({"content": ..., plus metadata}) lazily; every
+    chunk carries its page's source/category/region/destination.
+    """
+    for page in pages:
+        meta = {field: page.get(field) for field in METADATA_FIELDS}
+        for chunk in chunk_text(page["content"], max_tokens, overlap_tokens):
+            yield {"content": chunk, **meta}
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Group an iterable into lists of `size` (the last may be shorter)."""
+    if size < 1:
+        raise ValueError(f"Invalid batch size: {size}")
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,257 @@
+"""
+db_pool.py
+Thread-safe PostgreSQL connection pool for Tembo AI.
+
+Keeps a bounded set of psycopg2 connections open so requests reuse a warm
+(already TLS-negotiated) connection instead of dialing the database each time.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of psycopg2 connections.
+
+    - Blocks (up to `timeout` seconds) when all `max_size` connections are busy
+    - Health-checks idle connections on checkout (SELECT 1 after `check_interval`)
+    - Recycles connections older than `max_lifetime` or idle longer than `max_idle`
+    - Tracks checkout wait times so contention is visible under load
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], "psycopg2.extensions.connection"],
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 10.0,
+        max_lifetime: float = 1800.0,
+        max_idle: float = 300.0,
+        check_interval: float = 30.0,
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()          # (conn, created_at, last_used), most recent on the right
+        self._created_at = {}         # id(conn) -> created_at, for connections checked out
+        self._size = 0                # open connections (idle + in use)
+        self._closed = False
+
+        self._stats = {
+            "requests":   0,
+            "waits":      0,
+            "wait_ms":    0.0,
+            "max_wait_ms": 0.0,
+            "timeouts":   0,
+            "created":    0,
+            "recycled":   0,
+            "failed_checks": 0,
+        }
+
+    # ── Lifecycle ───────────────────────────────────────────────────────────────
+
+    def open(self):
+        """Pre-open `min_size` connections so the first requests skip the connect cost."""
+        with self._cond:
+            self._closed = False
+            missing = self.min_size - self._size
+            self._size += max(missing, 0)
+
+        for _ in range(max(missing, 0)):
+            try:
+                conn = self._new_connection()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic(), time.monotonic()))
+                self._cond.notify()
+
+    def close(self):
+        """Close every idle connection. Checked-out connections close when returned."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._close_quietly(conn)
+
+    # ── Checkout / return ───────────────────────────────────────────────────────
+
+    def getconn(self) -> "psycopg2.extensions.connection":
+        """Check out a healthy connection, waiting up to `timeout` seconds."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        with self._cond:
+            self._stats["requests"] += 1
+
+        while True:
+            entry = None
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout:.1f}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if entry is None:
+                try:
+                    conn = self._new_connection()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+            else:
+                conn, created_at, last_used = entry
+                if not self._is_healthy(conn, created_at, last_used):
+                    self._discard(conn)
+                    continue
+
+            self._record_wait(start, waited)
+            with self._cond:
+                self._created_at[id(conn)] = created_at
+            return conn
+
+    def putconn(self, conn: "psycopg2.extensions.connection", discard: bool = False):
+        """Return a connection, rolling back any open transaction first."""
+        with self._cond:
+            created_at = self._created_at.pop(id(conn), time.monotonic())
+
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+
+        now = time.monotonic()
+        if discard or conn.closed or self._closed or now - created_at > self.max_lifetime:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, created_at, now))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a `with` block.
+
+            with pool.connection() as conn:
+                ...
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    # ── Stats ───────────────────────────────────────────────────────────────────
+
+    def stats(self) -> dict:
+        """Snapshot of pool size and checkout wait times."""
+        with self._cond:
+            s = dict(self._stats)
+            idle = len(self._idle)
+            size = self._size
+        s["avg_wait_ms"] = round(s["wait_ms"] / s["requests"], 3) if s["requests"] else 0.0
+        s["wait_ms"] = round(s["wait_ms"], 3)
+        s["max_wait_ms"] = round(s["max_wait_ms"], 3)
+        s.update({
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "size":     size,
+            "idle":     idle,
+            "in_use":   size - idle,
+        })
+        return s
+
+    # ── Internals ───────────────────────────────────────────────────────────────
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _is_healthy(self, conn, created_at: float, last_used: float) -> bool:
+        now = time.monotonic()
+        if conn.closed or now - created_at > self.max_lifetime:
+            return False
+        if now - last_used > self.max_idle and self._size > self.min_size:
+            return False
+        if now - last_used > self.check_interval:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                with self._cond:
+                    self._stats["failed_checks"] += 1
+                return False
+        return True
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self._stats["recycled"] += 1
+            self._cond.notify()
+
+    def _record_wait(self, start: float, waited: bool):
+        wait_ms = (time.monotonic() - start) * 1000
+        with self._cond:
+            self._stats["wait_ms"] += wait_ms
+            self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], wait_ms)
+            if waited:
+                self._stats["waits"] += 1
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
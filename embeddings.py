@@ -1,24 +1,294 @@
 """
 embeddings.py
-Embeddings using Cohere API (FREE tier - 100 calls/min).
+Embedding backends for Tembo AI, chosen by EMBEDDING_BACKEND:
+
+  cohere  Cohere API (FREE tier - 100 calls/min) — the default
+  local   in-process CPU hashing embedder, no network (see LocalHashingEmbeddings)
 
 Get free API key at: https://dashboard.cohere.com/api-keys
 """
 
+import argparse
+import asyncio
+import math
 import os
+import random
+import re
+import threading
+import time
+import zlib
+import httpx
+import numpy as np
 import requests
-from typing import List
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from cache import LRUCache
+
 load_dotenv()
 
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "cohere").lower()
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 
+# ── Query embedding cache ───────────────────────────────────────────────────────
+# Identical questions ("best time to visit Masai Mara") skip the Cohere round trip
+# and don't count against the 100 calls/min quota.
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "5000"))
+EMBED_CACHE_TTL  = float(os.getenv("EMBED_CACHE_TTL", str(7 * 24 * 3600)))   # seconds
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH")   # e.g. .cache/query_embeddings.json
+EMBED_CACHE_SAVE_INTERVAL = float(os.getenv("EMBED_CACHE_SAVE_INTERVAL", "300"))   # seconds
+
+query_cache = LRUCache(
+    maxsize=EMBED_CACHE_SIZE,
+    ttl=EMBED_CACHE_TTL,
+    path=EMBED_CACHE_PATH,
+    save_interval=EMBED_CACHE_SAVE_INTERVAL,
+)
+
+
+def normalize_query(text: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", text).strip().rstrip("?!. ").lower()
+
+
+# ── Rate limiting, chunking and retries ────────────────────────────────────────
+# Cohere's free tier allows 100 embed calls/min and at most 96 texts per call.
+COHERE_CALLS_PER_MINUTE   = float(os.getenv("COHERE_CALLS_PER_MINUTE", "100"))
+COHERE_BURST              = int(os.getenv("COHERE_BURST", "5"))
+COHERE_MAX_TEXTS_PER_CALL = int(os.getenv("COHERE_MAX_TEXTS_PER_CALL", "96"))
+COHERE_MAX_PARALLEL       = int(os.getenv("COHERE_MAX_PARALLEL", "4"))
+COHERE_MAX_RETRIES        = int(os.getenv("COHERE_MAX_RETRIES", "6"))
+COHERE_BACKOFF_BASE       = float(os.getenv("COHERE_BACKOFF_BASE", "0.5"))    # seconds
+COHERE_BACKOFF_MAX        = float(os.getenv("COHERE_BACKOFF_MAX", "30"))      # seconds
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by sync and async callers.
+
+    reserve() takes a token immediately and returns how long the caller must
+    wait before using it, so sync code can time.sleep() and async code can
+    asyncio.sleep() on the same limiter.
+    """
+
+    def __init__(self, rate_per_sec: float, capacity: int):
+        self.rate = rate_per_sec
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+rate_limiter = TokenBucket(COHERE_CALLS_PER_MINUTE / 60, COHERE_BURST)
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """Honor Retry-After when given, else exponential backoff with full jitter."""
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, COHERE_BACKOFF_BASE)
+        except ValueError:
+            pass
+    return random.uniform(0, min(COHERE_BACKOFF_MAX, COHERE_BACKOFF_BASE * 2 ** attempt))
+
+
+def _chunks(texts: List[str], size: int) -> List[List[str]]:
+    return [texts[i:i + size] for i in range(0, len(texts), size)]
+
+
+# ── Micro-batching of concurrent query embeddings ──────────────────────────────
+# Concurrent /chat requests each need one query vector. Instead of one Cohere
+# call per request, queries arriving within a few milliseconds share one call.
+EMBED_COALESCE          = os.getenv("EMBED_COALESCE", "true").lower() == "true"
+EMBED_BATCH_MAX_SIZE    = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+
+
+class EmbeddingCoalescer:
+    """
+    Collects embed requests for up to `max_wait_ms` (or until `max_batch_size`
+    are waiting), sends them as one batched call, and resolves each caller's
+    future with its own vector. Identical texts in a batch are embedded once.
+    """
+
+    def __init__(
+        self,
+        embed_many: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+    ):
+        self.embed_many = embed_many
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.loop = asyncio.get_running_loop()
+
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self._batches = 0
+        self._items = 0
+        self._largest = 0
+
+    async def embed(self, text: str) -> List[float]:
+        future = self.loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self.loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = self.loop.create_task(self._run(batch))
+            # Hold a reference so the task isn't garbage-collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        unique = list(dict.fromkeys(text for text, _ in batch))
+        self._batches += 1
+        self._items += len(batch)
+        self._largest = max(self._largest, len(batch))
+        try:
+            vectors = dict(zip(unique, await self.embed_many(unique)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+    def stats(self) -> dict:
+        return {
+            "batches":        self._batches,
+            "queries":        self._items,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "max_batch_size": self._largest,
+        }
+
+
+# ── Backend interface ───────────────────────────────────────────────────────────
+
+class EmbeddingBackend(ABC):
+    """
+    What the rest of the app calls on `embedder`. A backend implements
+    embed_text, embed_batch and embed_queries_async (and aclose if it holds
+    clients or threads); query caching, coalescing and the LangChain names
+    are shared.
+
+    Each backend has its own vector space: after switching EMBEDDING_BACKEND,
+    re-embed the knowledge base (POST /reset?force=true).
+    """
+
+    model = "unknown"
+    dimension = 384             # must match VECTOR(384) in setup_vector.py
+    coalesce = EMBED_COALESCE   # share one call between concurrent queries
+
+    def __init__(self):
+        self._coalescer: Optional[EmbeddingCoalescer] = None
+
+    @abstractmethod
+    def embed_text(self, text: str) -> List[float]:
+        """Embed a single string."""
+
+    @abstractmethod
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents; results come back in input order."""
+
+    @abstractmethod
+    async def embed_queries_async(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries without blocking the event loop (in order)."""
+
+    async def aclose(self):
+        """Release clients or threads (called on app shutdown)."""
+
+    async def embed_text_async(self, text: str) -> List[float]:
+        """Embed a single string without blocking the event loop."""
+        return (await self.embed_queries_async([text]))[0]
+
+    async def embed_query_async(self, text: str) -> List[float]:
+        key = self._cache_key(text)
+        vector = query_cache.get(key)
+        if vector is None:
+            if self.coalesce:
+                vector = await self._get_coalescer().embed(text)
+            else:
+                vector = await self.embed_text_async(text)
+            query_cache.set(key, vector)
+        return vector
+
+    async def embed_query_batch_async(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries for batch search: cached ones are reused and the
+        distinct misses go out in one batched call.
+        """
+        keys = [self._cache_key(text) for text in texts]
+        vectors = {key: query_cache.get(key) for key in keys}
+        missing = {key: text for key, text in zip(keys, texts) if vectors[key] is None}
+        if missing:
+            embedded = await self.embed_queries_async(list(missing.values()))
+            for key, vector in zip(missing, embedded):
+                vectors[key] = vector
+                query_cache.set(key, vector)
+        return [vectors[key] for key in keys]
+
+    def _get_coalescer(self) -> "EmbeddingCoalescer":
+        # One coalescer per event loop (its futures can't cross loops)
+        loop = asyncio.get_running_loop()
+        if self._coalescer is None or self._coalescer.loop is not loop:
+            self._coalescer = EmbeddingCoalescer(
+                self.embed_queries_async,
+                max_batch_size=EMBED_BATCH_MAX_SIZE,
+                max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+            )
+        return self._coalescer
+
+    def coalescer_stats(self) -> dict:
+        return self._coalescer.stats() if self._coalescer is not None else {}
+
+    # ── LangChain compatibility ─────────────────────────────────────────────────
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_batch(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._cache_key(text)
+        vector = query_cache.get(key)
+        if vector is None:
+            vector = self.embed_text(text)
+            query_cache.set(key, vector)
+        return vector
 
-class CohereEmbeddings:
+    def _cache_key(self, text: str) -> str:
+        # Model is part of the key so a persisted cache never mixes vector spaces
+        return f"{self.model}:{normalize_query(text)}"
+
+
+class CohereEmbeddings(EmbeddingBackend):
     def __init__(self):
+        super().__init__()
         if not COHERE_API_KEY:
-            raise ValueError("COHERE_API_KEY not set. Get free key at https://dashboard.cohere.com/api-keys")
+            # Don't fail at import time; the first embed call raises instead
+            print("Warning: COHERE_API_KEY not set — Cohere embedding calls will fail")
         self.model = "embed-english-light-v3.0"  # Free tier model
         self.dimension = 384
         self.api_url = "https://api.cohere.ai/v1/embed"
@@ -26,54 +296,282 @@ class CohereEmbeddings:
             "Authorization": f"Bearer {COHERE_API_KEY}",
             "Content-Type": "application/json",
         }
+        self._async_client: Optional[httpx.AsyncClient] = None
         print(f"Using Cohere Embeddings: {self.model}")
 
+    @staticmethod
+    def _require_key():
+        if not COHERE_API_KEY:
+            raise ValueError("COHERE_API_KEY not set. Get free key at https://dashboard.cohere.com/api-keys")
+
+    def _post(self, texts: List[str], input_type: str, timeout: float) -> List[List[float]]:
+        """One embed request: rate limited, retried on 429/5xx and network errors."""
+        self._require_key()
+        payload = {
+            "model": self.model,
+            "texts": texts,
+            "input_type": input_type,
+            "truncate": "END"
+        }
+        for attempt in range(COHERE_MAX_RETRIES + 1):
+            time.sleep(rate_limiter.reserve())
+            try:
+                response = requests.post(self.api_url, headers=self.headers, json=payload, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == COHERE_MAX_RETRIES:
+                    raise
+                time.sleep(_backoff_delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < COHERE_MAX_RETRIES:
+                time.sleep(_backoff_delay(attempt, response.headers.get("Retry-After")))
+                continue
+            response.raise_for_status()
+            return response.json()["embeddings"]
+
     def embed_text(self, text: str) -> List[float]:
         """Embed a single string."""
-        response = requests.post(
-            self.api_url,
-            headers=self.headers,
-            json={
-                "model": self.model,
-                "texts": [text],
-                "input_type": "search_query",
-                "truncate": "END"
-            },
-            timeout=30
-        )
-        response.raise_for_status()
-        return response.json()["embeddings"][0]
+        return self._post([text], "search_query", timeout=30)[0]
 
     def embed_batch(self, texts: List[str]) -> List[List[float]]:
-        """Embed a list of strings."""
-        response = requests.post(
-            self.api_url,
-            headers=self.headers,
-            json={
-                "model": self.model,
-                "texts": texts,
-                "input_type": "search_document",
-                "truncate": "END"
-            },
-            timeout=60
+        """
+        Embed a list of strings. Large inputs are split into API-sized chunks
+        that run in parallel (bounded by COHERE_MAX_PARALLEL and the rate
+        limiter); results come back in input order.
+        """
+        chunks = _chunks(texts, COHERE_MAX_TEXTS_PER_CALL)
+        if len(chunks) <= 1:
+            return self._post(texts, "search_document", timeout=60) if texts else []
+
+        with ThreadPoolExecutor(max_workers=min(COHERE_MAX_PARALLEL, len(chunks))) as executor:
+            results = executor.map(lambda chunk: self._post(chunk, "search_document", timeout=60), chunks)
+            return [vector for chunk_vectors in results for vector in chunk_vectors]
+
+    # ── Async API (used by the /chat request path) ──────────────────────────────
+    def _get_async_client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(headers=self.headers, timeout=30)
+        return self._async_client
+
+    async def _post_async(self, texts: List[str], input_type: str) -> List[List[float]]:
+        """Async twin of _post, sharing the same rate limiter and retry policy."""
+        self._require_key()
+        payload = {
+            "model": self.model,
+            "texts": texts,
+            "input_type": input_type,
+            "truncate": "END"
+        }
+        for attempt in range(COHERE_MAX_RETRIES + 1):
+            await asyncio.sleep(rate_limiter.reserve())
+            try:
+                response = await self._get_async_client().post(self.api_url, json=payload)
+            except httpx.TransportError:
+                if attempt == COHERE_MAX_RETRIES:
+                    raise
+                await asyncio.sleep(_backoff_delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < COHERE_MAX_RETRIES:
+                await asyncio.sleep(_backoff_delay(attempt, response.headers.get("Retry-After")))
+                continue
+            response.raise_for_status()
+            return response.json()["embeddings"]
+
+    async def embed_queries_async(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries without blocking the event loop (chunked, in order)."""
+        chunks = _chunks(texts, COHERE_MAX_TEXTS_PER_CALL)
+        if len(chunks) <= 1:
+            return await self._post_async(texts, "search_query") if texts else []
+
+        semaphore = asyncio.Semaphore(COHERE_MAX_PARALLEL)
+
+        async def run(chunk: List[str]) -> List[List[float]]:
+            async with semaphore:
+                return await self._post_async(chunk, "search_query")
+
+        results = await asyncio.gather(*(run(chunk) for chunk in chunks))
+        return [vector for chunk_vectors in results for vector in chunk_vectors]
+
+    async def aclose(self):
+        """Close the shared async HTTP client (call on app shutdown)."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+# ── In-process CPU backend ──────────────────────────────────────────────────────
+# No network, GPU or model download: words, word bigrams and character
+# trigrams are feature-hashed into LOCAL_EMBED_BUCKETS buckets, weighted by
+# sublinear TF × IDF and mapped to 384 dims by a fixed random ±1 projection.
+# Projection and IDF weights are one .npz file, built from the corpus with:
+#   python embeddings.py --build-local .cache/local_embeddings.npz
+LOCAL_EMBED_PATH    = os.getenv("LOCAL_EMBED_PATH", ".cache/local_embeddings.npz")
+LOCAL_EMBED_BUCKETS = int(os.getenv("LOCAL_EMBED_BUCKETS", str(2 ** 15)))
+LOCAL_EMBED_THREADS = int(os.getenv("LOCAL_EMBED_THREADS", "4"))
+LOCAL_EMBED_BATCH   = int(os.getenv("LOCAL_EMBED_BATCH", "256"))    # texts per thread-pool task
+
+_WORDS = re.compile(r"\w+")
+
+# Feature weights: whole words dominate, bigrams add phrase matches and
+# trigrams give partial credit for inflections ("migrate" ~ "migration")
+_WORD_WEIGHT, _BIGRAM_WEIGHT, _TRIGRAM_WEIGHT = 1.0, 0.5, 0.2
+# Constant feature present in every text, so one without any word characters
+# ("", "?!") still gets a unit vector instead of all zeros (undefined cosine)
+_BIAS_FEATURE, _BIAS_WEIGHT = "<bias>", 0.1
+
+
+def _hashed_features(text: str, buckets: int) -> Dict[int, float]:
+    """Bucket → weight (before IDF) for one text."""
+    words = _WORDS.findall(text.lower())
+    features = Counter(words)
+    features.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    features.update(
+        f"#{padded[i:i + 3]}"
+        for padded in (f"<{w}>" for w in words)
+        for i in range(len(padded) - 2)
+    )
+    weights: Dict[int, float] = {}
+    for feature, count in features.items():
+        if feature[0] == "#":
+            kind = _TRIGRAM_WEIGHT
+        elif " " in feature:
+            kind = _BIGRAM_WEIGHT
+        else:
+            kind = _WORD_WEIGHT
+        bucket = zlib.crc32(feature.encode("utf-8")) % buckets
+        weights[bucket] = weights.get(bucket, 0.0) + kind * (1 + math.log(count))
+    bias = zlib.crc32(_BIAS_FEATURE.encode("utf-8")) % buckets
+    weights[bias] = weights.get(bias, 0.0) + _BIAS_WEIGHT
+    return weights
+
+
+class LocalHashingEmbeddings(EmbeddingBackend):
+    """
+    Hashing/projection embedder run on a local thread pool: a query takes
+    well under a millisecond of CPU. Retrieval quality is lexical (shared
+    words and word pieces), well below Cohere's, but needs nothing external.
+    """
+
+    coalesce = False   # a 5 ms batching window would cost more than the embedding
+
+    def __init__(self, path: Optional[str] = LOCAL_EMBED_PATH):
+        super().__init__()
+        if path and os.path.exists(path):
+            with np.load(path) as model:
+                self.projection = model["projection"]
+                self.idf = model["idf"]
+            source = path
+        else:
+            # Uniform IDF until a model file is built from the corpus
+            self.projection = self._random_projection(LOCAL_EMBED_BUCKETS, self.dimension)
+            self.idf = np.ones(LOCAL_EMBED_BUCKETS, dtype=np.float32)
+            source = "built-in projection, no IDF"
+        self.buckets, self.dimension = self.projection.shape
+        # Fingerprint keeps query-cache keys of different model files apart;
+        # "b" marks vectors with the bias feature, so older rows get re-embedded
+        fingerprint = zlib.crc32(self.idf.tobytes(), zlib.crc32(self.projection.tobytes()))
+        self.model = f"local-hashing-b{self.buckets}-{fingerprint:08x}"
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        print(f"Using local hashing embeddings: {self.model} ({source})")
+
+    @staticmethod
+    def _random_projection(buckets: int, dimension: int, seed: int = 0) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        return np.where(rng.random((buckets, dimension)) < 0.5, -1, 1).astype(np.int8)
+
+    @classmethod
+    def build(cls, texts: List[str], path: str, buckets: int = LOCAL_EMBED_BUCKETS, dimension: int = 384):
+        """Fit IDF weights on `texts` and save them with a projection to `path`."""
+        document_frequency = np.zeros(buckets, dtype=np.float64)
+        for text in texts:
+            document_frequency[list(_hashed_features(text, buckets))] += 1
+        idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(
+            path,
+            projection=cls._random_projection(buckets, dimension),
+            idf=idf.astype(np.float32),
         )
-        response.raise_for_status()
-        return response.json()["embeddings"]
+        print(f"Saved local embedding model ({len(texts)} texts, {buckets} buckets) to {path}")
 
-    # ── LangChain compatibility ─────────────────────────────────────────────────
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return self.embed_batch(texts)
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = _hashed_features(text, self.buckets)
+            buckets = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+            weights = np.fromiter(features.values(), dtype=np.float32, count=len(features))
+            vectors[row] = (weights * self.idf[buckets]) @ self.projection[buckets]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        return vectors.tolist()
 
-    def embed_query(self, text: str) -> List[float]:
-        return self.embed_text(text)
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=LOCAL_EMBED_THREADS, thread_name_prefix="embed",
+                )
+            return self._executor
+
+    def embed_text(self, text: str) -> List[float]:
+        """Embed a single string (in the calling thread; it is sub-millisecond)."""
+        return self._embed([text])[0]
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed many strings, LOCAL_EMBED_BATCH per task across the thread pool."""
+        chunks = _chunks(texts, LOCAL_EMBED_BATCH)
+        if len(chunks) <= 1:
+            return self._embed(texts) if texts else []
+        results = self._get_executor().map(self._embed, chunks)
+        return [vector for chunk_vectors in results for vector in chunk_vectors]
+
+    async def embed_queries_async(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries on the thread pool, off the event loop."""
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), self._embed, texts)
+
+    async def aclose(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+# ── Backend selection ───────────────────────────────────────────────────────────
+
+BACKENDS = {
+    "cohere": CohereEmbeddings,
+    "local":  LocalHashingEmbeddings,
+}
+
+
+def create_embedder(backend: str = EMBEDDING_BACKEND) -> EmbeddingBackend:
+    """Instantiate the backend named by EMBEDDING_BACKEND."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND={backend!r}; choose one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend]()
 
 
 # Singleton — import this everywhere
-embedder = CohereEmbeddings()
+embedder = create_embedder()
 
 
 # ── Quick test ──────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding backend check / local model builder.")
+    parser.add_argument("--build-local", metavar="PATH",
+                        help="fit the local hashing embedder on the knowledge base and save it to PATH")
+    args = parser.parse_args()
+
+    if args.build_local:
+        from massive_kenya_data import MASSIVE_KENYA_DATA
+        LocalHashingEmbeddings.build([doc["content"] for doc in MASSIVE_KENYA_DATA], args.build_local)
+        raise SystemExit(0)
+
     test_sentences = [
         "Best time to visit Masai Mara",
         "When is the wildebeest migration in Kenya?",
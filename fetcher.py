@@ -0,0 +1,318 @@
+"""
+fetcher.py
+Concurrent, cache-aware page fetcher for the Tembo AI scraper.
+
+- Pages are fetched concurrently (httpx, asyncio), at most `max_concurrency`
+  in total and `per_host` at a time against any one host
+- Every response is kept in an on-disk cache (one JSON file per URL); the next
+  fetch sends If-None-Match / If-Modified-Since, so an unchanged page costs a
+  304 and no body
+- Pages whose server sends no validators are compared by body hash, so an
+  unchanged page is still reported as unchanged
+- Network errors, 429 and 5xx are retried with exponential backoff (honoring
+  Retry-After); a page that still fails falls back to its cached copy
+
+    fetcher = Fetcher()
+    for page in fetcher.fetch_many(urls):
+        if page["changed"]:
+            ...
+
+For long URL lists, iter_pages() yields pages as they complete with at most
+SCRAPE_WINDOW of them in flight, so memory doesn't grow with the list. With
+`defer_cache`, a new or changed body is only written to the cache when the
+caller calls save(page) — e.g. once the page has been ingested — so a failed
+ingestion is seen as changed again next time.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SCRAPE_CACHE_DIR       = os.getenv("SCRAPE_CACHE_DIR", ".cache/http")
+SCRAPE_MAX_CONCURRENCY = int(os.getenv("SCRAPE_MAX_CONCURRENCY", "32"))
+SCRAPE_PER_HOST        = int(os.getenv("SCRAPE_PER_HOST", "4"))
+SCRAPE_TIMEOUT         = float(os.getenv("SCRAPE_TIMEOUT", "10"))        # seconds
+SCRAPE_MAX_RETRIES     = int(os.getenv("SCRAPE_MAX_RETRIES", "3"))
+SCRAPE_BACKOFF_BASE    = float(os.getenv("SCRAPE_BACKOFF_BASE", "0.5"))  # seconds
+SCRAPE_BACKOFF_MAX     = float(os.getenv("SCRAPE_BACKOFF_MAX", "10"))    # seconds
+SCRAPE_WINDOW          = int(os.getenv("SCRAPE_WINDOW", "64"))           # pages in flight for iter_pages()
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+
+# ── On-disk HTTP cache ──────────────────────────────────────────────────────────
+
+class HttpCache:
+    """
+    One JSON file per URL under `directory`, holding the body and the
+    validators (ETag, Last-Modified) needed for the next conditional GET.
+    """
+
+    def __init__(self, directory: str = SCRAPE_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def get(self, url: str) -> Optional[dict]:
+        path = self._path(url)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable cache entry for {url}: {e}")
+            return None
+        return entry if entry.get("url") == url else None
+
+    def set(self, url: str, entry: dict):
+        """Write one entry (temp file + rename, so a crash never leaves it half-written)."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**entry, "url": url}, f)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.directory, name))
+
+
+def _body_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+# ── Fetcher ─────────────────────────────────────────────────────────────────────
+
+class Fetcher:
+    """Fetches many URLs concurrently through an HttpCache."""
+
+    def __init__(
+        self,
+        cache: Optional[HttpCache] = None,
+        max_concurrency: int = SCRAPE_MAX_CONCURRENCY,
+        per_host: int = SCRAPE_PER_HOST,
+        timeout: float = SCRAPE_TIMEOUT,
+        max_retries: int = SCRAPE_MAX_RETRIES,
+        backoff_base: float = SCRAPE_BACKOFF_BASE,
+        max_age: float = 0.0,
+        headers: Optional[dict] = None,
+    ):
+        if max_concurrency < 1 or per_host < 1:
+            raise ValueError(f"Invalid limits: max_concurrency={max_concurrency}, per_host={per_host}")
+        self.cache = cache if cache is not None else HttpCache()
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_age = max_age            # seconds a cached page is trusted without revalidating
+        self.headers = headers or DEFAULT_HEADERS
+        self._stats = {
+            "requests":      0,
+            "fetched":       0,   # 200 with a new or changed body
+            "not_modified":  0,   # 304, or 200 with an identical body
+            "fresh":         0,   # served from cache without a request (max_age)
+            "retries":       0,
+            "failed":        0,
+            "stale":         0,   # failed, served the cached copy instead
+        }
+
+    def fetch_many(self, urls: List[str]) -> List[dict]:
+        """Blocking wrapper around fetch_all() for scripts."""
+        return asyncio.run(self.fetch_all(urls))
+
+    async def fetch_all(self, urls: List[str]) -> List[dict]:
+        """
+        Fetch `urls` concurrently; results come back in input order as dicts:
+        url, status, text, changed, from_cache, error, seconds.
+        """
+        urls = list(dict.fromkeys(urls))   # each page once
+        async with self._client() as client:
+            run = self._limited(client)
+            return await asyncio.gather(*(run(url) for url in urls))
+
+    def iter_pages(
+        self, urls: Iterable[str], window: int = SCRAPE_WINDOW, defer_cache: bool = False,
+    ) -> Iterator[dict]:
+        """
+        Fetch `urls` concurrently and yield each result as it completes
+        (completion order, same dicts as fetch_all). At most `window` pages
+        are in flight or waiting to be consumed, so memory stays bounded
+        however many URLs there are. With `defer_cache`, fetched bodies are
+        cached only by save(page).
+        """
+        if window < 1:
+            raise ValueError(f"Invalid window: {window}")
+        urls = iter(dict.fromkeys(urls))
+        loop = asyncio.new_event_loop()
+        client = self._client()
+        run = self._limited(client, defer_cache)
+        pending = set()
+        try:
+            while True:
+                for url in itertools.islice(urls, window - len(pending)):
+                    pending.add(loop.create_task(run(url)))
+                if not pending:
+                    break
+                done, pending = loop.run_until_complete(
+                    asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            # Consumer stopped early (or raised): cancel what's still in flight
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            loop.run_until_complete(client.aclose())
+            loop.close()
+
+    def _client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency,
+        )
+        return httpx.AsyncClient(
+            headers=self.headers, timeout=self.timeout, limits=limits, follow_redirects=True,
+        )
+
+    def save(self, page: dict):
+        """Write the cache entry an iter_pages(defer_cache=True) result held back."""
+        entry = page.get("cache_entry")
+        if entry:
+            self.cache.set(page["url"], entry)
+
+    def _limited(self, client: httpx.AsyncClient, defer_cache: bool = False) -> Callable[[str], Awaitable[dict]]:
+        """_fetch through `client`, within the overall and per-host limits."""
+        overall = asyncio.Semaphore(self.max_concurrency)
+        per_host: Dict[str, asyncio.Semaphore] = {}
+
+        async def run(url: str) -> dict:
+            host = urlsplit(url).netloc.lower()
+            if host not in per_host:
+                per_host[host] = asyncio.Semaphore(self.per_host)
+            async with per_host[host], overall:
+                return await self._fetch(client, url, defer_cache)
+
+        return run
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str, defer_cache: bool = False) -> dict:
+        start = time.perf_counter()
+        cached = self.cache.get(url)
+        if cached and self.max_age and time.time() - cached.get("fetched_at", 0) < self.max_age:
+            self._stats["fresh"] += 1
+            return self._result(url, cached["status"], cached["text"], False, True, None, start)
+
+        request_headers = {}
+        if cached:
+            if cached.get("etag"):
+                request_headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                request_headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            response = await self._get(client, url, request_headers)
+        except httpx.HTTPError as e:
+            return self._failed(url, cached, f"{type(e).__name__}: {e}", start)
+
+        if response.status_code == 304 and cached:
+            self._stats["not_modified"] += 1
+            self.cache.set(url, {**cached, "fetched_at": time.time()})
+            return self._result(url, 304, cached["text"], False, True, None, start)
+        if response.status_code >= 400:
+            return self._failed(url, cached, f"HTTP {response.status_code}", start)
+
+        text = response.text
+        digest = _body_hash(text)
+        changed = cached is None or cached.get("sha256") != digest
+        self._stats["fetched" if changed else "not_modified"] += 1
+        entry = {
+            "status":        response.status_code,
+            "etag":          response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "sha256":        digest,
+            "fetched_at":    time.time(),
+            "text":          text,
+        }
+        result = self._result(url, response.status_code, text, changed, False, None, start)
+        if defer_cache:
+            result["cache_entry"] = entry
+        else:
+            self.cache.set(url, entry)
+        return result
+
+    async def _get(self, client: httpx.AsyncClient, url: str, headers: dict) -> httpx.Response:
+        """One GET, retried on network errors, 429 and 5xx."""
+        for attempt in range(self.max_retries + 1):
+            self._stats["requests"] += 1
+            try:
+                response = await client.get(url, headers=headers)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                self._stats["retries"] += 1
+                await asyncio.sleep(self._backoff_delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                self._stats["retries"] += 1
+                await asyncio.sleep(self._backoff_delay(attempt, response.headers.get("Retry-After")))
+                continue
+            return response
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Honor Retry-After (seconds) when given, else exponential backoff with full jitter."""
+        if retry_after:
+            try:
+                return min(float(retry_after), SCRAPE_BACKOFF_MAX)
+            except ValueError:
+                pass
+        return random.uniform(0, min(SCRAPE_BACKOFF_MAX, self.backoff_base * 2 ** attempt))
+
+    def _failed(self, url: str, cached: Optional[dict], error: str, start: float) -> dict:
+        print(f"Error fetching {url}: {error}")
+        if cached:
+            self._stats["stale"] += 1
+            return self._result(url, cached["status"], cached["text"], False, True, error, start)
+        self._stats["failed"] += 1
+        return self._result(url, None, "", False, False, error, start)
+
+    @staticmethod
+    def _result(url, status, text, changed, from_cache, error, start) -> dict:
+        return {
+            "url":        url,
+            "status":     status,
+            "text":       text,
+            "changed":    changed,
+            "from_cache": from_cache,
+            "error":      error,
+            "seconds":    round(time.perf_counter() - start, 4),
+        }
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "max_concurrency": self.max_concurrency,
+            "per_host":        self.per_host,
+        }
@@ -2,6 +2,17 @@ import { useState, useRef, useEffect } from 'react'
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000'
 
+// Parse one Server-Sent Event block ("event: x\ndata: {...}")
+function parseSSE(raw) {
+  let event = 'message'
+  let data = ''
+  for (const line of raw.split('\n')) {
+    if (line.startsWith('event:')) event = line.slice(6).trim()
+    else if (line.startsWith('data:')) data += line.slice(5).trim()
+  }
+  return { event, data: data ? JSON.parse(data) : {} }
+}
+
 // Typing effect hook
 function useTypingEffect(text, speed = 20, enabled = true) {
   const [displayedText, setDisplayedText] = useState('')
@@ -61,7 +72,7 @@ function App() {
     setIsLoading(true)
 
     try {
-      const response = await fetch(`${API_URL}/chat`, {
+      const response = await fetch(`${API_URL}/chat/stream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
@@ -71,20 +82,46 @@ function App() {
         })
       })
 
-      if (!response.ok) throw new Error('Failed to get response')
-
-      const data = await response.json()
-      
-      setMessages(prev => [...prev, { 
-        role: 'assistant', 
-        content: data.answer,
-        sources: data.sources,
-        timestamp: new Date(),
-        animate: true 
-      }])
+      if (!response.ok || !response.body) throw new Error('Failed to get response')
+
+      // Update the assistant message that is currently streaming in
+      const updateLast = (fn) => setMessages(prev => [...prev.slice(0, -1), fn(prev[prev.length - 1])])
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+
+        buffer += decoder.decode(value, { stream: true })
+        const events = buffer.split('\n\n')
+        buffer = events.pop()
+
+        for (const raw of events) {
+          const { event, data } = parseSSE(raw)
+          if (event === 'sources') {
+            setIsLoading(false)
+            setMessages(prev => [...prev, {
+              role: 'assistant',
+              content: '',
+              sources: data.sources,
+              timestamp: new Date(),
+              streaming: true
+            }])
+          } else if (event === 'token') {
+            updateLast(m => ({ ...m, content: m.content + data.text }))
+          } else if (event === 'done') {
+            updateLast(m => ({ ...m, streaming: false }))
+          } else if (event === 'error') {
+            throw new Error(data.detail)
+          }
+        }
+      }
 
     } catch (error) {
-      setMessages(prev => [...prev, { 
+      setMessages(prev => [...prev.map(m => m.streaming ? { ...m, streaming: false } : m), { 
         role: 'assistant', 
         content: 'Samahani! (Sorry) I encountered an error. Please try again.',
         isError: true,
@@ -331,13 +368,13 @@ function ChatMessage({ message, isLatest }) {
               : 'bg-gradient-to-br from-slate-800/90 to-slate-800/70 text-slate-100 rounded-tl-sm border border-slate-700/50 shadow-emerald-500/5'
         }`}>
           <p className="whitespace-pre-wrap leading-relaxed text-sm sm:text-base">{text}</p>
-          {!isComplete && isLatest && message.animate && !isUser && (
+          {((!isComplete && isLatest && message.animate) || message.streaming) && !isUser && (
             <span className="inline-block w-2 h-4 sm:h-5 bg-emerald-400 ml-1 animate-pulse rounded-sm"></span>
           )}
         </div>
 
         {/* Sources */}
-        {message.sources && message.sources.length > 0 && isComplete && (
+        {message.sources && message.sources.length > 0 && isComplete && !message.streaming && (
           <div className="mt-2 sm:mt-3 flex flex-wrap gap-1.5 sm:gap-2 animate-fade-in">
             {message.sources.slice(0, 3).map((source, i) => (
               <span 
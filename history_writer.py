@@ -0,0 +1,241 @@
+"""
+history_writer.py
+Write-behind queue for chat history in Tembo AI.
+
+Chat turns are appended to an in-memory buffer and a background thread
+flushes them to `chat_sessions` in multi-row INSERTs, so the HTTP response
+no longer waits for two commits per turn.
+
+- Flushes when `batch_size` messages are waiting or the oldest has waited
+  `flush_interval` seconds, whichever comes first
+- Bounded: producers block (up to `enqueue_timeout`) once `max_backlog`
+  messages are buffered, then get HistoryBacklogFull
+- Each message is timestamped at enqueue time, so batching never reorders a
+  session's history; unflushed messages stay readable via pending()
+- close() drains everything still buffered (also registered with atexit)
+"""
+
+import atexit
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import psycopg2
+import psycopg2.extras
+
+from db_pool import PoolTimeout
+
+INSERT_MESSAGES_SQL = "INSERT INTO chat_sessions (session_id, role, content, created_at) VALUES %s"
+
+# Worth retrying: the database is unreachable or the pool is exhausted
+TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout)
+
+
+class HistoryBacklogFull(Exception):
+    """Raised when the write-behind buffer stays full for `enqueue_timeout` seconds."""
+
+
+class HistoryWriter:
+    """Batches chat_sessions inserts on a background thread."""
+
+    def __init__(
+        self,
+        pool,
+        batch_size: int = 100,
+        flush_interval: float = 0.05,
+        max_backlog: int = 10000,
+        enqueue_timeout: float = 5.0,
+        drain_retries: int = 3,
+    ):
+        if batch_size < 1 or max_backlog < batch_size:
+            raise ValueError(f"Invalid sizes: batch_size={batch_size}, max_backlog={max_backlog}")
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.enqueue_timeout = enqueue_timeout
+        self.drain_retries = drain_retries
+
+        self._cond = threading.Condition()
+        self._buffer = deque()         # (session_id, role, content, created_at, enqueued_at)
+        self._inflight: List[tuple] = []
+        self._thread: Optional[threading.Thread] = None
+        self._atexit_registered = False
+        self._closing = False
+        self._flush_waiters = 0        # flush() callers; skip the batching delay for them
+        self._last_created_at = datetime.min.replace(tzinfo=timezone.utc)
+
+        self._enqueued = 0             # messages accepted so far
+        self._done = 0                 # messages written (or dropped) so far
+        self._stats = {
+            "batches":       0,
+            "written":       0,
+            "dropped":       0,
+            "retries":       0,
+            "blocked":       0,
+            "max_backlog_seen": 0,
+        }
+
+    # ── Producers ───────────────────────────────────────────────────────────────
+
+    def enqueue(self, session_id: str, role: str, content: str, timeout: Optional[float] = None):
+        """Buffer one message, blocking while the backlog is full (backpressure)."""
+        timeout = self.enqueue_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if len(self._buffer) >= self.max_backlog:
+                self._stats["blocked"] += 1
+            while len(self._buffer) >= self.max_backlog:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise HistoryBacklogFull(
+                        f"Chat history backlog full ({self.max_backlog} messages) for {timeout:.1f}s"
+                    )
+                self._cond.wait(remaining)
+            self._append(session_id, role, content)
+
+    def try_enqueue(self, session_id: str, role: str, content: str) -> bool:
+        """Non-blocking enqueue for the event loop; False when the backlog is full."""
+        with self._cond:
+            if len(self._buffer) >= self.max_backlog:
+                return False
+            self._append(session_id, role, content)
+            return True
+
+    def _append(self, session_id: str, role: str, content: str):
+        # Strictly increasing timestamps keep same-session order even within one batch
+        created_at = max(datetime.now(timezone.utc), self._last_created_at + timedelta(microseconds=1))
+        self._last_created_at = created_at
+        self._buffer.append((session_id, role, content, created_at, time.monotonic()))
+        self._enqueued += 1
+        self._stats["max_backlog_seen"] = max(self._stats["max_backlog_seen"], len(self._buffer))
+        self._ensure_started()
+        self._cond.notify_all()
+
+    def pending(self, session_id: str) -> List[dict]:
+        """Messages for `session_id` not yet committed, oldest first."""
+        with self._cond:
+            return [
+                {"role": role, "content": content, "created_at": created_at}
+                for sid, role, content, created_at, _ in (*self._inflight, *self._buffer)
+                if sid == session_id
+            ]
+
+    # ── Lifecycle ───────────────────────────────────────────────────────────────
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything enqueued so far is written. False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._enqueued
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                while self._done < target:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            finally:
+                self._flush_waiters -= 1
+        return True
+
+    def close(self, timeout: Optional[float] = 30.0):
+        """Drain the buffer and stop the flush thread."""
+        with self._cond:
+            self._closing = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        with self._cond:
+            if thread is None or not thread.is_alive():
+                self._thread = None
+            self._closing = False
+
+    def _ensure_started(self):
+        # Called with the lock held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    # ── Flush thread ────────────────────────────────────────────────────────────
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closing:
+                    self._cond.wait()
+                if not self._buffer:
+                    return   # closing and fully drained
+
+                # Let the batch fill up until the oldest message has waited flush_interval
+                deadline = self._buffer[0][4] + self.flush_interval
+                while len(self._buffer) < self.batch_size and not (self._closing or self._flush_waiters):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                count = min(len(self._buffer), self.batch_size)
+                self._inflight = [self._buffer.popleft() for _ in range(count)]
+                batch = self._inflight
+                self._cond.notify_all()   # wake producers blocked on a full backlog
+
+            try:
+                written = self._write(batch)
+            except Exception as e:
+                # Never let one bad batch stop the thread: everything after it would back up
+                print(f"Dropping {len(batch)} chat history messages: {type(e).__name__}: {e}")
+                written = False
+
+            with self._cond:
+                self._inflight = []
+                self._done += len(batch)
+                self._stats["batches"] += 1
+                self._stats["written" if written else "dropped"] += len(batch)
+                self._cond.notify_all()
+
+    def _write(self, batch: List[tuple]) -> bool:
+        """Insert one batch, retrying transient errors. False if it had to be dropped."""
+        rows = [(sid, role, content, created_at) for sid, role, content, created_at, _ in batch]
+        attempt = 0
+        while True:
+            try:
+                with self.pool.connection() as conn:
+                    with conn.cursor() as cur:
+                        psycopg2.extras.execute_values(cur, INSERT_MESSAGES_SQL, rows, page_size=len(rows))
+                    conn.commit()
+                return True
+            except TRANSIENT_ERRORS as e:
+                attempt += 1
+                with self._cond:
+                    self._stats["retries"] += 1
+                    closing = self._closing
+                if closing and attempt > self.drain_retries:
+                    print(f"Dropping {len(rows)} chat history messages on shutdown: {e}")
+                    return False
+                # The backlog keeps absorbing new turns (up to max_backlog) meanwhile
+                time.sleep(min(0.1 * 2 ** attempt, 5.0))
+            except (psycopg2.Error, ValueError) as e:
+                # Not retryable: bad data (e.g. a NUL in a string) fails every attempt
+                print(f"Dropping {len(rows)} chat history messages: {e}")
+                return False
+
+    def stats(self) -> dict:
+        with self._cond:
+            s = dict(self._stats)
+            s.update({
+                "backlog":     len(self._buffer),
+                "in_flight":   len(self._inflight),
+                "max_backlog": self.max_backlog,
+                "batch_size":  self.batch_size,
+            })
+        flushed = s["written"] + s["dropped"]
+        s["avg_batch_size"] = round(flushed / s["batches"], 2) if s["batches"] else 0.0
+        return s
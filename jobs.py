@@ -0,0 +1,210 @@
+"""
+jobs.py
+Background jobs for Tembo AI (knowledge base ingestion).
+
+POST /setup and POST /reset submit a job and return its id at once; the work
+runs on a dedicated thread, never on an API worker, and GET /jobs/{id}
+reports its progress. Jobs run one at a time (two ingestions racing over the
+same table would only duplicate work) and live in memory, so ids do not
+survive a restart.
+
+On shutdown a running job is asked to stop at its next progress() call (the
+end of a batch) and joined, so it never outlives the connection pool it
+writes through.
+"""
+
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds shutdown() waits for a running job to reach its next batch boundary
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "30"))
+
+
+class JobInterrupted(Exception):
+    """Raised inside a job by progress() once shutdown has asked it to stop."""
+
+
+class Job:
+    """State of one background job; updated by the worker, read by /jobs/{id}."""
+
+    def __init__(self, kind: str, total_docs: int = 0):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"          # queued → running → succeeded | failed | interrupted
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+        self.total_docs = total_docs
+        self.batches_total = 0
+        self.batches_done = 0
+        self.docs_done = 0
+        self.errors: List[str] = []
+        self.result: Optional[dict] = None
+
+        self._lock = threading.Lock()
+        self._started = 0.0             # perf_counter at start, for docs/sec
+        self._stop = threading.Event()
+
+    def progress(self, batches_done: int, batches_total: int, docs_done: int, docs_total: int):
+        """
+        Progress callback passed to the ingestion functions (called after each
+        batch). Raises JobInterrupted once the job has been asked to stop.
+        """
+        if self._stop.is_set():
+            raise JobInterrupted("interrupted by shutdown")
+        with self._lock:
+            self.batches_done = batches_done
+            self.batches_total = batches_total
+            self.docs_done = docs_done
+            self.total_docs = docs_total
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            if self.started_at is None:
+                elapsed = 0.0
+            elif self.finished_at is None:
+                elapsed = time.perf_counter() - self._started
+            else:
+                elapsed = (self.finished_at - self.started_at).total_seconds()
+            return {
+                "id":            self.id,
+                "kind":          self.kind,
+                "status":        self.status,
+                "created_at":    self.created_at.isoformat(),
+                "started_at":    self.started_at.isoformat() if self.started_at else None,
+                "finished_at":   self.finished_at.isoformat() if self.finished_at else None,
+                "total_docs":    self.total_docs,
+                "batches_total": self.batches_total,
+                "batches_done":  self.batches_done,
+                "docs_done":     self.docs_done,
+                "seconds":       round(elapsed, 3),
+                "docs_per_sec":  round(self.docs_done / elapsed, 1) if elapsed else 0.0,
+                "errors":        list(self.errors),
+                "result":        self.result,
+            }
+
+
+class JobManager:
+    """Runs submitted jobs one at a time on a background thread."""
+
+    def __init__(self, max_jobs: int = 50):
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._futures: Dict[str, Future] = {}    # job id → future, until it finishes
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def submit(self, kind: str, fn: Callable[[Job], dict], total_docs: int = 0) -> Job:
+        """
+        Queue `fn(job)`; its return value becomes job.result. If a job of the
+        same kind is already queued or running, that job is returned instead.
+        """
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == kind and job.active:
+                    return job
+
+            job = Job(kind, total_docs)
+            self._jobs[job.id] = job
+            self._trim()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+            self._futures[job.id] = self._executor.submit(self._run, job, fn)
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[dict]:
+        """Most recent first."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def shutdown(self, timeout: float = JOB_SHUTDOWN_TIMEOUT):
+        """
+        Stop accepting work. Queued jobs are cancelled; a running one is asked
+        to stop and joined for up to `timeout` seconds. Jobs that did not
+        finish are marked interrupted.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+            futures = dict(self._futures)
+            pending = [job for job in self._jobs.values() if job.active]
+        for job in pending:
+            job._stop.set()
+        if executor is None:
+            return
+        executor.shutdown(wait=False, cancel_futures=True)
+        # Cancelled futures never count as done for wait(); only join the running one
+        running = [future for future in futures.values() if not future.cancelled()]
+        _, not_done = wait(running, timeout=timeout)
+        for job in pending:
+            if job.active:
+                if futures.get(job.id) in not_done:
+                    print(f"Job {job.id} ({job.kind}) still running after {timeout:g}s; abandoning it")
+                self._interrupt(job)
+
+    def _run(self, job: Job, fn: Callable[[Job], dict]):
+        try:
+            self._execute(job, fn)
+        finally:
+            with self._lock:
+                self._futures.pop(job.id, None)
+
+    def _execute(self, job: Job, fn: Callable[[Job], dict]):
+        with job._lock:
+            job.status = "running"
+            job.started_at = datetime.now(timezone.utc)
+            job._started = time.perf_counter()
+        try:
+            result = fn(job)
+            status = "succeeded"
+        except JobInterrupted:
+            print(f"Job {job.id} ({job.kind}) interrupted by shutdown")
+            self._interrupt(job)
+            return
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            traceback.print_exc()
+            result = None
+            status = "failed"
+            with job._lock:
+                job.errors.append(f"{type(e).__name__}: {e}")
+        with job._lock:
+            job.result = result
+            job.status = status
+            job.finished_at = datetime.now(timezone.utc)
+
+    @staticmethod
+    def _interrupt(job: Job):
+        with job._lock:
+            job.status = "interrupted"
+            job.errors.append("interrupted by shutdown")
+            job.finished_at = datetime.now(timezone.utc)
+
+    def _trim(self):
+        # Called with the lock held: forget the oldest finished jobs
+        for job_id in [j.id for j in self._jobs.values() if not j.active]:
+            if len(self._jobs) <= self.max_jobs:
+                break
+            del self._jobs[job_id]
+
+
+jobs = JobManager()
@@ -6,21 +6,80 @@ Run:  uvicorn main:app --reload
 Docs: http://localhost:8000/docs
 """
 
+import asyncio
+import json
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 
-from rag import ChatRequest, ChatResponse, rag_answer
-from vector_store import get_document_count
+from embeddings import embedder, query_cache
+from jobs import jobs
+from metrics import register_stats, render_latest
+from rag import (
+    ChatRequest, ChatResponse, SearchRequest, SearchResponse,
+    answer_cache, rag_answer_async, rag_answer_stream, search_async,
+)
+from vector_store import (
+    get_document_count, get_pool_stats, pool,
+    get_async_pool_stats, open_async_pool, close_async_pool,
+    memory_index, use_memory_index, MIGRATE_ON_STARTUP, migrate_schema,
+    history_writer, get_history_writer_stats, get_history_cache_stats,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Component stats published on /metrics (read at scrape time)
+register_stats("db_pool",           get_pool_stats)
+register_stats("async_db_pool",     get_async_pool_stats)
+register_stats("embedding_cache",   query_cache.stats)
+register_stats("embedding_batcher", embedder.coalescer_stats)
+register_stats("answer_cache",      answer_cache.stats)
+register_stats("history_writer",    get_history_writer_stats)
+register_stats("history_cache",     get_history_cache_stats)
+register_stats("vector_index",      lambda: memory_index.stats() if use_memory_index() else None)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the DB connection pools on startup and close them on shutdown."""
+    try:
+        pool.open()
+    except Exception as e:
+        # Don't block startup — connections are opened on demand later
+        logger.warning(f"Could not pre-open DB connections: {str(e)}")
+    if MIGRATE_ON_STARTUP:
+        try:
+            await asyncio.to_thread(migrate_schema)
+        except Exception as e:
+            # Searches still work on the old schema (hybrid falls back to vector)
+            logger.warning(f"Could not apply schema migrations: {str(e)}")
+    # Async pool connects in the background; it never blocks startup
+    await open_async_pool()
+    if use_memory_index():
+        try:
+            await asyncio.to_thread(memory_index.refresh, True)
+        except Exception as e:
+            logger.warning(f"Could not load in-memory vector index: {str(e)}")
+    yield
+    # Queued ingestion jobs are dropped; a running one stops at its next batch
+    # and is joined (JOB_SHUTDOWN_TIMEOUT) before the pools close under it
+    await asyncio.to_thread(jobs.shutdown)
+    # Drain buffered chat history before the pool it writes through goes away
+    await asyncio.to_thread(history_writer.close)
+    await close_async_pool()
+    await embedder.aclose()
+    pool.close()
+
+
 app = FastAPI(
     title="🐘 Tembo AI",
     description="Kenya Travel Assistant — local embeddings + pgvector + Groq (free)",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -44,7 +103,7 @@ def root():
 
 # ── Main chat endpoint ────────────────────────────────────────────────────────────
 @app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest):
     """
     Send a message → get a Kenya travel answer grounded in the knowledge base.
 
@@ -53,10 +112,11 @@ def chat(request: ChatRequest):
     - Generation: Groq Llama 3.3 70B (free)
     """
     try:
-        result = rag_answer(
+        result = await rag_answer_async(
             question=request.message,
             session_id=request.session_id,
             category_filter=request.category_filter,
+            use_cache=request.use_cache,
         )
         return ChatResponse(**result)
     except Exception as e:
@@ -64,6 +124,58 @@ def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ── Retrieval-only batch search ───────────────────────────────────────────────────
+@app.post("/search", response_model=SearchResponse)
+async def search(request: SearchRequest):
+    """
+    Retrieval without generation, for internal tools and evaluation jobs:
+    many queries in, the top_k chunks with similarity scores for each out.
+    """
+    try:
+        return SearchResponse(**await search_async(
+            request.queries,
+            top_k=request.top_k,
+            category_filter=request.category_filter,
+            region_filter=request.region_filter,
+        ))
+    except Exception as e:
+        logger.error(f"Search endpoint error: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ── Streaming chat endpoint (Server-Sent Events) ───────────────────────────────────
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Same as /chat, but streamed as Server-Sent Events:
+    `sources` first, then one `token` event per generated chunk, then `done`.
+    Errors after the stream has started arrive as an `error` event.
+    """
+    async def event_stream():
+        try:
+            async for event in rag_answer_stream(
+                question=request.message,
+                session_id=request.session_id,
+                category_filter=request.category_filter,
+                use_cache=request.use_cache,
+            ):
+                yield _sse(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Chat stream error: {str(e)}", exc_info=True)
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Stop proxies (nginx, Render) from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # ── DB health check ───────────────────────────────────────────────────────────────
 @app.get("/health")
 def health():
@@ -73,65 +185,111 @@ def health():
         return {
             "status":             "ok",
             "documents_in_kb":    count,
-            "embedding_model":    "embed-english-light-v3.0 (Cohere)",
+            "embedding_model":    embedder.model,
             "llm":                "groq/llama-3.3-70b-versatile",
+            "db_pool":            get_pool_stats(),
+            "async_db_pool":      get_async_pool_stats(),
+            "embedding_cache":    query_cache.stats(),
+            "embedding_batcher":  embedder.coalescer_stats(),
+            "answer_cache":       answer_cache.stats(),
+            "history_writer":     get_history_writer_stats(),
+            "history_cache":      get_history_cache_stats(),
+            "vector_index":       memory_index.stats() if use_memory_index() else None,
         }
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"DB error: {str(e)}")
 
 
+# ── Prometheus metrics ────────────────────────────────────────────────────────────
+@app.get("/metrics")
+def metrics():
+    """Per-stage latency histograms, LLM token counts, error counters and pool/cache stats."""
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+
 # ── Setup endpoint (populate database) ────────────────────────────────────────────
-@app.post("/setup")
+def _job_accepted(job, message: str) -> dict:
+    return {
+        "status":     "accepted",
+        "message":    message,
+        "job_id":     job.id,
+        "job_status": job.status,
+        "status_url": f"/jobs/{job.id}",
+    }
+
+
+@app.post("/setup", status_code=202)
 def setup_database():
-    """One-time setup: populate the database with Kenya travel data."""
-    try:
-        from massive_kenya_data import populate_massive_database
-        result = populate_massive_database()
-        return {"status": "ok", "message": "Database populated", "details": result}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Setup error: {str(e)}")
+    """
+    One-time setup: populate the database with Kenya travel data.
+    Runs as a background job — poll `status_url` for progress.
+    """
+    from massive_kenya_data import MASSIVE_KENYA_DATA, populate_massive_database
+
+    job = jobs.submit(
+        "setup",
+        lambda job: populate_massive_database(progress=job.progress),
+        total_docs=len(MASSIVE_KENYA_DATA),
+    )
+    return _job_accepted(job, "Database population started")
 
 
 # ── Reset endpoint (clear and repopulate database) ────────────────────────────────
-@app.post("/reset")
-def reset_database():
-    """Force clear and repopulate the database with latest Kenya travel data."""
-    try:
-        from vector_store import clear_knowledge_base
-        from massive_kenya_data import populate_massive_database, MASSIVE_KENYA_DATA
-        
-        # Clear existing data
+def _reset_job(job, force: bool) -> dict:
+    from vector_store import clear_knowledge_base, sync_documents
+    from massive_kenya_data import INGEST_BATCH_SIZE, MASSIVE_KENYA_DATA, load_documents
+
+    if force:
         clear_knowledge_base()
         logger.info("Database cleared, repopulating...")
-        
-        # Force repopulate (modify temp to bypass check)
-        from vector_store import add_documents_simple
-        
-        texts = [doc["content"] for doc in MASSIVE_KENYA_DATA]
-        metadatas = [
-            {
-                "source": doc["source"],
-                "category": doc["category"],
-                "region": doc["region"],
-                "destination": doc["destination"],
-            }
-            for doc in MASSIVE_KENYA_DATA
-        ]
-        
-        # Add in batches
-        batch_size = 50
-        total_added = 0
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i+batch_size]
-            batch_meta = metadatas[i:i+batch_size]
-            count = add_documents_simple(batch_texts, batch_meta)
-            total_added += count
-        
+        stats = load_documents(MASSIVE_KENYA_DATA, progress=job.progress)
         return {
-            "status": "ok", 
             "message": "Database reset complete",
-            "documents_added": total_added
+            "documents_added": stats["documents_added"],
+            "docs_per_sec": stats["docs_per_sec"],
         }
-    except Exception as e:
-        logger.error(f"Reset error: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Reset error: {str(e)}")
\ No newline at end of file
+
+    diff = sync_documents(MASSIVE_KENYA_DATA, batch_size=INGEST_BATCH_SIZE, progress=job.progress)
+    return {
+        "message": "Database synced",
+        "documents_added": diff["added"],
+        "documents_deleted": diff["deleted"],
+        "documents_unchanged": diff["unchanged"],
+    }
+
+
+@app.post("/reset", status_code=202)
+def reset_database(force: bool = False):
+    """
+    Bring the database in line with the latest Kenya travel data.
+
+    By default only new or changed curated documents are embedded and removed
+    ones deleted (content-hash diff); scraped pages are left alone.
+    `?force=true` clears the whole table and re-embeds the curated data.
+    Runs as a background job — poll `status_url` for progress.
+    """
+    from massive_kenya_data import MASSIVE_KENYA_DATA
+
+    job = jobs.submit(
+        "reset_force" if force else "reset",
+        lambda job: _reset_job(job, force),
+        total_docs=len(MASSIVE_KENYA_DATA),
+    )
+    return _job_accepted(job, "Database reset started" if force else "Database sync started")
+
+
+# ── Background jobs ───────────────────────────────────────────────────────────────
+@app.get("/jobs")
+def list_jobs():
+    """Recent background jobs, newest first."""
+    return {"jobs": jobs.list()}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Progress of a background job: batches done, docs/sec, errors and final result."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.to_dict()
@@ -5,7 +5,9 @@ Comprehensive Kenya travel knowledge base with 200+ documents.
 Run: python massive_kenya_data.py
 """
 
-from vector_store import add_documents_simple, get_document_count, clear_knowledge_base
+import time
+
+from vector_store import CURATED_CORPUS, add_documents_simple, get_document_count, sync_documents
 
 # ══════════════════════════════════════════════════════════════════════════════
 # MASSIVE KENYA TRAVEL KNOWLEDGE BASE - 200+ Documents
@@ -557,7 +559,51 @@ MASSIVE_KENYA_DATA = [
 ]
 
 
-def populate_massive_database():
+# Rows per COPY. embed_batch splits each batch into Cohere-sized (96 text)
+# requests and runs them in parallel within the rate limit.
+INGEST_BATCH_SIZE = 500
+
+
+def load_documents(docs: list, batch_size: int = INGEST_BATCH_SIZE, progress=None) -> dict:
+    """
+    Embed and bulk-insert knowledge base entries in batches.
+    Each batch is one (parallel, chunked) embed plus one COPY. Returns counts and throughput.
+    `progress(batches_done, batches_total, docs_done, docs_total)` runs after each batch.
+    """
+    start = time.perf_counter()
+    total_added = 0
+    batches = (len(docs) + batch_size - 1) // batch_size
+    if progress:
+        progress(0, batches, 0, len(docs))
+    for i in range(0, len(docs), batch_size):
+        batch = docs[i:i + batch_size]
+        count = add_documents_simple(
+            [doc["content"] for doc in batch],
+            [
+                {
+                    "source": doc.get("source"),
+                    "category": doc.get("category"),
+                    "region": doc.get("region"),
+                    "destination": doc.get("destination"),
+                }
+                for doc in batch
+            ],
+            corpus=CURATED_CORPUS,
+        )
+        total_added += count
+        print(f"  Batch {i // batch_size + 1}: Added {count} documents (Total: {total_added})")
+        if progress:
+            progress(i // batch_size + 1, batches, total_added, len(docs))
+
+    seconds = time.perf_counter() - start
+    return {
+        "documents_added": total_added,
+        "seconds":         round(seconds, 3),
+        "docs_per_sec":    round(total_added / seconds, 1) if seconds else 0.0,
+    }
+
+
+def populate_massive_database(progress=None):
     """Add comprehensive Kenya travel data to the vector database."""
     print("=" * 70)
     print("🐘 TEMBO AI - MASSIVE Kenya Knowledge Base Population")
@@ -566,15 +612,7 @@ def populate_massive_database():
     current_count = get_document_count()
     print(f"\nCurrent documents in database: {current_count}")
     
-    # Skip if already populated (for server)
-    if current_count >= 200:
-        return {"status": "already_populated", "documents": current_count}
-    
-    if current_count > 0:
-        clear_knowledge_base()
-        print("Database cleared.")
-    
-    print(f"\nPreparing to add {len(MASSIVE_KENYA_DATA)} documents...")
+    print(f"\nSyncing {len(MASSIVE_KENYA_DATA)} documents...")
     print("This is a comprehensive knowledge base covering:")
     print("  • National Parks & Reserves")
     print("  • Beaches & Coastal Areas")
@@ -584,30 +622,13 @@ def populate_massive_database():
     print("  • Sample Itineraries")
     print("  • Safari Logistics")
     
-    # Extract texts and metadata
-    texts = [doc["content"] for doc in MASSIVE_KENYA_DATA]
-    metadatas = [
-        {
-            "source": doc["source"],
-            "category": doc["category"],
-            "region": doc["region"],
-            "destination": doc["destination"],
-        }
-        for doc in MASSIVE_KENYA_DATA
-    ]
-    
-    # Add in batches to avoid memory issues
-    batch_size = 50
-    total_added = 0
-    
-    print(f"\nEmbedding and inserting documents in batches of {batch_size}...")
-    
-    for i in range(0, len(texts), batch_size):
-        batch_texts = texts[i:i+batch_size]
-        batch_meta = metadatas[i:i+batch_size]
-        count = add_documents_simple(batch_texts, batch_meta)
-        total_added += count
-        print(f"  Batch {i//batch_size + 1}: Added {count} documents (Total: {total_added})")
+    # Only new or changed documents are embedded; removed ones are deleted
+    start = time.perf_counter()
+    diff = sync_documents(MASSIVE_KENYA_DATA, batch_size=INGEST_BATCH_SIZE, progress=progress)
+    seconds = time.perf_counter() - start
+    total_added = diff["added"]
+    print(f"  Added {diff['added']}, deleted {diff['deleted']}, unchanged {diff['unchanged']} "
+          f"in {seconds:.1f}s")
     
     final_count = get_document_count()
     print(f"\n{'='*70}")
@@ -636,7 +657,14 @@ def populate_massive_database():
     print("🎉 Comprehensive knowledge base ready!")
     print(f"{'='*70}")
     
-    return {"status": "populated", "documents_added": total_added, "total_documents": final_count}
+    return {
+        "status": "populated" if diff["added"] or diff["deleted"] else "already_populated",
+        "documents_added": total_added,
+        "documents_deleted": diff["deleted"],
+        "documents_unchanged": diff["unchanged"],
+        "total_documents": final_count,
+        "seconds": round(seconds, 3),
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,247 @@
+"""
+metrics.py
+Prometheus metrics for Tembo AI (exposed on /metrics by main.py).
+
+  tembo_rag_stage_seconds{stage}              per-stage latency histogram
+  tembo_rag_request_seconds{pipeline}         end-to-end latency per pipeline
+  tembo_rag_requests_total{pipeline,outcome}  answered / cached / no_results / error
+  tembo_rag_errors_total{stage}               exceptions raised inside a stage
+  tembo_llm_tokens_total{type}                prompt / completion tokens reported by Groq
+  tembo_prompt_tokens{section}                estimated prompt tokens per section
+  tembo_prompt_trimmed_total{kind}            chunks dropped/truncated, turns dropped by the budget
+  tembo_<component>_<stat>                    pool and cache stats, read at scrape time
+
+Recording a stage is two perf_counter() calls and one histogram observe
+(a couple of microseconds), so it stays on in production.
+"""
+
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# 1 ms (cache hit, in-process search) up to 30 s (slow 70B completion)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# embed → cache → search → history → prompt → llm → persist
+STAGES = ("embed", "cache", "search", "history", "prompt", "llm", "persist")
+
+STAGE_SECONDS = Histogram(
+    "tembo_rag_stage_seconds", "Latency of each RAG pipeline stage",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "tembo_rag_request_seconds", "End-to-end RAG latency",
+    ["pipeline"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    "tembo_rag_requests", "RAG requests by outcome",
+    ["pipeline", "outcome"],
+)
+ERRORS = Counter(
+    "tembo_rag_errors", "Exceptions raised inside a RAG stage",
+    ["stage"],
+)
+LLM_TOKENS = Counter(
+    "tembo_llm_tokens", "Tokens reported by the LLM API",
+    ["type"],
+)
+PROMPT_TOKENS = Histogram(
+    "tembo_prompt_tokens", "Estimated prompt tokens per section",
+    ["section"], buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000),
+)
+PROMPT_TRIMMED = Counter(
+    "tembo_prompt_trimmed", "Prompt parts cut to fit the token budget",
+    ["kind"],
+)
+
+
+# ── Observers ───────────────────────────────────────────────────────────────────
+# Extra consumers of raw timings (e.g. benchmark.py computing exact percentiles).
+# Called as observer(stage, seconds); "request" is used for end-to-end timings.
+_observers: List[Callable[[str, float], None]] = []
+
+
+def add_observer(observer: Callable[[str, float], None]):
+    _observers.append(observer)
+
+
+def remove_observer(observer: Callable[[str, float], None]):
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+# ── Stage timing ────────────────────────────────────────────────────────────────
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Time one pipeline stage; exceptions are counted against the stage.
+
+        with stage_timer("search"):
+            chunks = similarity_search(...)
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.labels(stage=stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+        for observer in _observers:
+            observer(stage, elapsed)
+
+
+async def timed(stage: str, awaitable):
+    """Await `awaitable` under stage_timer (for stages run concurrently via gather)."""
+    with stage_timer(stage):
+        return await awaitable
+
+
+def record_llm_usage(usage):
+    """Count prompt/completion tokens from a Groq `usage` object (None is ignored)."""
+    if usage is None or not METRICS_ENABLED:
+        return
+    LLM_TOKENS.labels(type="prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(type="completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def record_prompt_usage(usage: dict):
+    """Record a prompt_builder usage report (estimated tokens, what was trimmed)."""
+    if not METRICS_ENABLED:
+        return
+    for section in ("system", "question", "context", "history", "total"):
+        PROMPT_TOKENS.labels(section=section).observe(usage[section])
+    for kind in ("chunks_dropped", "chunks_truncated", "turns_dropped"):
+        if usage[kind]:
+            PROMPT_TRIMMED.labels(kind=kind).inc(usage[kind])
+
+
+def _outcome(result: Optional[dict]) -> str:
+    if not result:
+        return "answered"
+    if result.get("cached"):
+        return "cached"
+    if result.get("context_used") == 0:
+        return "no_results"
+    return "answered"
+
+
+def observe_pipeline(pipeline: str):
+    """
+    Decorator recording end-to-end latency and outcome of a RAG entry point.
+    Works on plain functions, coroutines and async generators (for the latter
+    the outcome is read from the `sources` event).
+    """
+    def decorator(fn: Callable):
+        def finish(start: float, outcome: str):
+            elapsed = time.perf_counter() - start
+            REQUEST_SECONDS.labels(pipeline=pipeline).observe(elapsed)
+            REQUESTS.labels(pipeline=pipeline, outcome=outcome).inc()
+            for observer in _observers:
+                observer("request", elapsed)
+
+        if inspect.isasyncgenfunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                if not METRICS_ENABLED:
+                    async for event in fn(*args, **kwargs):
+                        yield event
+                    return
+                start, outcome = time.perf_counter(), "answered"
+                try:
+                    async for event in fn(*args, **kwargs):
+                        if event.get("event") == "sources":
+                            outcome = _outcome(event.get("data"))
+                        yield event
+                except Exception:
+                    outcome = "error"
+                    raise
+                finally:
+                    finish(start, outcome)
+            return wrapper
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                if not METRICS_ENABLED:
+                    return await fn(*args, **kwargs)
+                start, outcome = time.perf_counter(), "error"
+                try:
+                    result = await fn(*args, **kwargs)
+                    outcome = _outcome(result)
+                    return result
+                finally:
+                    finish(start, outcome)
+            return wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return fn(*args, **kwargs)
+            start, outcome = time.perf_counter(), "error"
+            try:
+                result = fn(*args, **kwargs)
+                outcome = _outcome(result)
+                return result
+            finally:
+                finish(start, outcome)
+        return wrapper
+
+    return decorator
+
+
+# ── Component stats (pools, caches) ─────────────────────────────────────────────
+
+class StatsCollector:
+    """
+    Exposes the numeric fields of existing `stats()` dicts as gauges, read only
+    when Prometheus scrapes, so the hot path pays nothing for them.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], Optional[dict]]] = {}
+
+    def register(self, component: str, stats_fn: Callable[[], Optional[dict]]):
+        self._sources[component] = stats_fn
+
+    def collect(self):
+        for component, stats_fn in list(self._sources.items()):
+            try:
+                stats = stats_fn() or {}
+            except Exception:
+                continue   # a broken component must not break the whole scrape
+            for key, value in stats.items():
+                if isinstance(value, (int, float)):
+                    yield GaugeMetricFamily(
+                        f"tembo_{component}_{key}", f"{component} {key}", value=float(value)
+                    )
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+def register_stats(component: str, stats_fn: Callable[[], Optional[dict]]):
+    """Publish `stats_fn()` (e.g. pool.stats) as tembo_<component>_<key> gauges."""
+    stats_collector.register(component, stats_fn)
+
+
+def render_latest() -> tuple:
+    """(body, content_type) for the /metrics endpoint."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
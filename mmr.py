@@ -0,0 +1,68 @@
+"""
+mmr.py
+Maximal marginal relevance (MMR) re-ranking for Tembo AI retrieval.
+
+The knowledge base holds many near-identical chunks per destination, so the
+top-k by similarity often repeats one fact several times. MMR picks chunks
+greedily, each maximizing
+
+    lambda_mult * relevance - (1 - lambda_mult) * max similarity to the picked ones
+
+so a near-duplicate of an already picked chunk loses to a slightly less
+relevant chunk that adds something new. lambda_mult=1 keeps relevance order;
+lower values favor diversity.
+
+The pairwise similarities of the candidate pool are one matrix product and
+each pick updates a running maximum, so selecting k of n costs O(n² · dim)
+once plus O(k · n).
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr_select(
+    query_vector: Sequence[float],
+    candidate_vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = 0.7,
+    relevance: Optional[Sequence[float]] = None,
+) -> List[int]:
+    """
+    Indices of `k` candidates in MMR order. Relevance defaults to cosine
+    similarity to `query_vector`; pass `relevance` to rank by another score
+    (e.g. a fused hybrid score scaled to [0, 1]).
+    """
+    if not 0.0 <= lambda_mult <= 1.0:
+        raise ValueError(f"lambda_mult must be in [0, 1], got {lambda_mult}")
+    vectors = _normalize(np.asarray(candidate_vectors, dtype=np.float32))
+    n = vectors.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    if relevance is None:
+        relevance = vectors @ _normalize(np.asarray(query_vector, dtype=np.float32))
+    else:
+        relevance = np.asarray(relevance, dtype=np.float32)
+    pairwise = vectors @ vectors.T                  # (n, n) cosine similarities
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    redundancy = pairwise[first].copy()             # max similarity to any picked candidate
+    available = np.ones(n, dtype=bool)
+    available[first] = False
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
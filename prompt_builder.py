@@ -0,0 +1,146 @@
+"""
+prompt_builder.py
+Token-budgeted prompt assembly for Tembo AI.
+
+Groq latency and quota both scale with input tokens, so the prompt is fitted
+to a budget instead of always sending every history turn and whole chunks.
+Priority order:
+  1. system prompt and the question — always sent in full
+  2. retrieved context — best-ranked chunks first; the last-ranked chunks are
+     dropped first, and a chunk that only partly fits (or would take more
+     than half the context budget) is truncated
+  3. chat history — newest turns first; the oldest turns are dropped first
+
+History is guaranteed `history_share` of the budget left after (1) when it
+needs it; context gets the rest, and whatever context leaves unused flows
+back to history.
+"""
+
+import math
+import re
+from typing import List, Tuple
+
+# Role/formatting tokens the chat template adds around every message
+MESSAGE_OVERHEAD = 4
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local token estimate (no tokenizer download): one token per
+    punctuation mark and roughly one per 5 characters of each word. Not
+    exact, but close enough to budget by; Groq's `usage` has the real count.
+    """
+    return sum(math.ceil(len(p) / 5) for p in _PIECES.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to about `max_tokens`, preferring a sentence, then a word boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Scale by the chars-per-token ratio until it fits (leaving a token for
+    # the "…"), then back off to a boundary
+    target = max(max_tokens - 1, 1)
+    cut = text
+    while len(cut) > 1 and estimate_tokens(cut) > target:
+        cut = cut[: min(int(len(cut) * target / estimate_tokens(cut)), len(cut) - 1)]
+    sentence_end = max(cut.rfind(". "), cut.rfind("! "), cut.rfind("? "))
+    if sentence_end > len(cut) // 2:
+        return cut[: sentence_end + 1]
+    word_end = cut.rfind(" ")
+    return (cut[:word_end] if word_end > 0 else cut).rstrip(",;:") + ("…" if max_tokens > 1 else "")
+
+
+def format_chunk(index: int, chunk: dict, content: str) -> str:
+    dest = chunk.get("destination", "Kenya")
+    src  = chunk.get("source", "unknown")
+    return f"[{index}. {dest} | {src}]\n{content}"
+
+
+def format_question(question: str, context: str) -> str:
+    return (
+        f"CONTEXT (use only this to answer):\n"
+        f"---\n{context}\n---\n\n"
+        f"QUESTION: {question}"
+    )
+
+
+def build_prompt(
+    system_prompt: str,
+    question: str,
+    chunks: List[dict],
+    history: List[dict],
+    budget: int,
+    history_share: float = 0.25,
+    min_chunk_tokens: int = 40,
+) -> Tuple[List[dict], List[dict], dict]:
+    """
+    Fit system prompt, history and context into `budget` estimated tokens.
+
+    `chunks` must be in rank order (best first), `history` oldest first.
+    Returns (messages, chunks actually used, usage report).
+    """
+    system_tokens   = estimate_tokens(system_prompt) + MESSAGE_OVERHEAD
+    question_tokens = estimate_tokens(format_question(question, "")) + MESSAGE_OVERHEAD
+    available = max(budget - system_tokens - question_tokens, 0)
+
+    history_costs = [estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in history]
+    history_floor = min(sum(history_costs), int(available * history_share))
+
+    # ── Context: best-ranked first, truncate the one that straddles the limit ──
+    context_budget = available - history_floor
+    # One oversized page must not crowd out every other chunk
+    chunk_cap = max(context_budget // 2, min_chunk_tokens) if len(chunks) > 1 else context_budget
+    context_tokens = 0
+    used_chunks, parts, truncated = [], [], 0
+    for chunk in chunks:
+        label_tokens = estimate_tokens(format_chunk(len(used_chunks) + 1, chunk, "")) + 1
+        remaining = context_budget - context_tokens - label_tokens
+        content = chunk["content"]
+        cost = estimate_tokens(content)
+        allowance = cost
+        if cost > remaining:
+            if used_chunks and remaining < min_chunk_tokens:
+                break   # what's left is better spent on history than on a stub of a chunk
+            # Truncate to the room left; the best chunk always goes in, even
+            # if the budget is nearly gone
+            allowance = max(remaining, min_chunk_tokens)
+        allowance = min(allowance, max(chunk_cap, min_chunk_tokens))
+        if cost > allowance:
+            content = truncate_to_tokens(content, allowance)
+            cost = estimate_tokens(content)
+            truncated += 1
+        used_chunks.append(chunk)
+        parts.append(format_chunk(len(used_chunks), chunk, content))
+        context_tokens += label_tokens + cost
+
+    # ── History: newest turns first, with whatever context left over ───────────
+    history_budget = available - context_tokens
+    kept, history_tokens = [], 0
+    for message, cost in zip(reversed(history), reversed(history_costs)):
+        if history_tokens + cost > history_budget:
+            break
+        kept.append({"role": message["role"], "content": message["content"]})
+        history_tokens += cost
+    kept.reverse()
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        *kept,
+        {"role": "user", "content": format_question(question, "\n\n".join(parts))},
+    ]
+    usage = {
+        "budget":           budget,
+        "system":           system_tokens,
+        "question":         question_tokens,
+        "context":          context_tokens,
+        "history":          history_tokens,
+        "total":            system_tokens + question_tokens + context_tokens + history_tokens,
+        "chunks_used":      len(used_chunks),
+        "chunks_dropped":   len(chunks) - len(used_chunks),
+        "chunks_truncated": truncated,
+        "turns_used":       len(kept),
+        "turns_dropped":    len(history) - len(kept),
+    }
+    return messages, used_chunks, usage
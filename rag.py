@@ -8,24 +8,45 @@ Stack (100% free):
   - Groq API               → fast, free LLM (Llama 3.3 70B)
 """
 
+import asyncio
 import os
-from typing import Optional
+from typing import AsyncIterator, List, Optional, Tuple
 from dotenv import load_dotenv
-from groq import Groq
-from pydantic import BaseModel
+from groq import AsyncGroq, Groq
+from pydantic import BaseModel, Field
 
-from vector_store import similarity_search, get_history, save_message
+from cache import SemanticCache
+from embeddings import embedder
+from metrics import observe_pipeline, record_llm_usage, record_prompt_usage, stage_timer, timed
+from prompt_builder import build_prompt
+from vector_store import (
+    similarity_search, get_history, save_message,
+    similarity_search_async, get_history_async, save_message_async,
+    batch_similarity_search_async, on_knowledge_base_change,
+)
 
 load_dotenv()
 
 # ── Groq client ─────────────────────────────────────────────────────────────────
 client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+async_client = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
 
 # Groq free models (pick one):
 #   llama-3.3-70b-versatile   ← best quality, still fast
 #   llama3-8b-8192            ← fastest, great for demos
 #   mixtral-8x7b-32768        ← large context window
 MODEL = "llama-3.3-70b-versatile"
+TEMPERATURE = 0.5
+MAX_TOKENS = 800
+
+# Input side: system prompt + history + context are fitted to this many
+# (estimated) tokens; see prompt_builder.py for the priority order.
+PROMPT_TOKEN_BUDGET     = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+PROMPT_HISTORY_SHARE    = float(os.getenv("PROMPT_HISTORY_SHARE", "0.25"))
+PROMPT_MIN_CHUNK_TOKENS = int(os.getenv("PROMPT_MIN_CHUNK_TOKENS", "40"))
+
+# /search (retrieval only): queries per request
+SEARCH_MAX_QUERIES = int(os.getenv("SEARCH_MAX_QUERIES", "100"))
 
 # ── System prompt ────────────────────────────────────────────────────────────────
 SYSTEM_PROMPT = """You are Tembo 🐘, a passionate and knowledgeable AI travel guide who LOVES Kenya.
@@ -57,102 +78,390 @@ EXAMPLE TONE:
 """
 
 
+# ── Semantic answer cache ─────────────────────────────────────────────────────────
+# Paraphrased questions ("Mara entry fee?" / "How much is it to enter Masai Mara?")
+# reuse a recent answer instead of paying for search + a 70B completion.
+# Only for turns without chat history: an answer shaped by one conversation
+# must not reach another, and a follow-up ("what about the price there?")
+# depends on its own conversation.
+ANSWER_CACHE_ENABLED   = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIZE      = int(os.getenv("ANSWER_CACHE_SIZE", "500"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))   # cosine similarity
+ANSWER_CACHE_TTL       = float(os.getenv("ANSWER_CACHE_TTL", "3600"))          # seconds
+
+answer_cache = SemanticCache(
+    maxsize=ANSWER_CACHE_SIZE,
+    threshold=ANSWER_CACHE_THRESHOLD,
+    ttl=ANSWER_CACHE_TTL,
+)
+# Stale answers must never outlive the documents they were built from
+on_knowledge_base_change(answer_cache.clear)
+
+
+def _cache_lookup(query_vector, top_k: int, category_filter: Optional[str], use_cache: bool) -> Optional[dict]:
+    if not (ANSWER_CACHE_ENABLED and use_cache):
+        return None
+    with stage_timer("cache"):
+        hit = answer_cache.lookup(query_vector, namespace=(category_filter, top_k))
+    return {**hit, "cached": True, "tokens": None} if hit else None
+
+
+def _cache_store(query_vector, top_k: int, category_filter: Optional[str], result: dict):
+    if ANSWER_CACHE_ENABLED:
+        answer_cache.store(query_vector, result, namespace=(category_filter, top_k))
+
+
+# ── Pipeline helpers (shared by the sync and async paths) ─────────────────────────
+NO_RESULTS_RESPONSE = {
+    "answer": (
+        "Samahani (Sorry), I don't have information on that yet. "
+        "Try asking about Masai Mara, Diani Beach, Amboseli, or Nairobi."
+    ),
+    "sources": [],
+    "context_used": 0,
+}
+
+
+def normalize_filter(category_filter: Optional[str]) -> Optional[str]:
+    """Normalize "null"-ish strings sent by the frontend to None."""
+    if category_filter in (None, "null", "None", ""):
+        return None
+    return category_filter
+
+
+def build_messages(question: str, chunks: List[dict], history: List[dict]) -> Tuple[List[dict], List[dict], dict]:
+    """
+    Assemble system prompt, chat history and retrieved context into Groq
+    messages within PROMPT_TOKEN_BUDGET.
+    Returns (messages, chunks actually used, estimated token usage).
+    """
+    messages, used_chunks, usage = build_prompt(
+        SYSTEM_PROMPT,
+        question,
+        chunks,
+        history,
+        budget=PROMPT_TOKEN_BUDGET,
+        history_share=PROMPT_HISTORY_SHARE,
+        min_chunk_tokens=PROMPT_MIN_CHUNK_TOKENS,
+    )
+    record_prompt_usage(usage)
+    return messages, used_chunks, usage
+
+
+def token_report(usage: dict, llm_usage=None) -> dict:
+    """Per-request token usage: the budget estimate plus what Groq reported."""
+    return {
+        **usage,
+        "llm_prompt":     getattr(llm_usage, "prompt_tokens", None),
+        "llm_completion": getattr(llm_usage, "completion_tokens", None),
+    }
+
+
+def format_sources(chunks: List[dict]) -> List[dict]:
+    return [
+        {
+            "destination": c.get("destination", "Unknown"),
+            "source":      c.get("source", "Unknown"),
+            "similarity":  round(c.get("similarity", 0), 3),
+        }
+        for c in chunks
+    ]
+
+
 # ── Core RAG function ─────────────────────────────────────────────────────────────
+@observe_pipeline("sync")
 def rag_answer(
     question: str,
     session_id: Optional[str] = None,
     top_k: int = 5,
     category_filter: Optional[str] = None,
+    use_cache: bool = True,
 ) -> dict:
     """
     Full RAG pipeline:
-      1. Embed query locally  →  free, instant
-      2. Search pgvector      →  top_k relevant chunks
-      3. Load chat history    →  for conversational context
-      4. Call Groq LLM        →  generate grounded answer
+      1. Embed query          →  cached for repeated questions
+      2. Load chat history    →  for conversational context
+         Check answer cache   →  paraphrases of a recent question return instantly
+                                 (first turns only; never across conversations)
+      3. Search pgvector      →  top_k relevant chunks
+      4. Call Groq LLM        →  prompt fitted to PROMPT_TOKEN_BUDGET, grounded answer
       5. Save to history
       6. Return answer + sources
+
+    `use_cache=False` skips the answer-cache lookup (the fresh answer is still stored).
     """
 
     # Normalize "null" string to None
-    if category_filter in (None, "null", "None", ""):
-        category_filter = None
+    category_filter = normalize_filter(category_filter)
 
-    # ── 1 & 2: Semantic search (fully local, no API cost) ────────────────────────
-    chunks = similarity_search(
-        query=question,
-        top_k=top_k,
-        category_filter=category_filter,
-    )
+    # ── 1: Embed the question ────────────────────────────────────────────────────
+    with stage_timer("embed"):
+        query_vector = embedder.embed_query(question)
+
+    # ── 2: Recent chat history, then the semantic answer cache ───────────────────
+    with stage_timer("history"):
+        history = get_history(session_id, limit=6) if session_id else []
+
+    cached = None if history else _cache_lookup(query_vector, top_k, category_filter, use_cache)
+    if cached:
+        if session_id:
+            with stage_timer("persist"):
+                save_message(session_id, "user", question)
+                save_message(session_id, "assistant", cached["answer"])
+        return cached
+
+    # ── 3: Semantic search ────────────────────────────────────────────────────────
+    with stage_timer("search"):
+        chunks = similarity_search(
+            query=question,
+            top_k=top_k,
+            category_filter=category_filter,
+            query_vector=query_vector,
+        )
 
     if not chunks:
-        return {
-            "answer": (
-                "Samahani (Sorry), I don't have information on that yet. "
-                "Try asking about Masai Mara, Diani Beach, Amboseli, or Nairobi."
-            ),
-            "sources": [],
-            "context_used": 0,
-        }
+        return dict(NO_RESULTS_RESPONSE)
 
-    # ── 3: Build context block from retrieved chunks ──────────────────────────────
-    context_parts = []
-    for i, chunk in enumerate(chunks, 1):
-        dest = chunk.get("destination", "Kenya")
-        src  = chunk.get("source", "unknown")
-        context_parts.append(f"[{i}. {dest} | {src}]\n{chunk['content']}")
+    # ── 4: Build prompt and call Groq (fast + free) ───────────────────────────────
+    with stage_timer("prompt"):
+        messages, chunks, usage = build_messages(question, chunks, history)
 
-    context = "\n\n".join(context_parts)
+    with stage_timer("llm"):
+        response = client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+        )
+    llm_usage = getattr(response, "usage", None)
+    record_llm_usage(llm_usage)
+    answer = response.choices[0].message.content
 
-    # ── 4: Load recent chat history ───────────────────────────────────────────────
-    history_messages = []
+    # ── 5: Save exchange to history ───────────────────────────────────────────────
     if session_id:
-        for msg in get_history(session_id, limit=6):
-            history_messages.append({"role": msg["role"], "content": msg["content"]})
+        with stage_timer("persist"):
+            save_message(session_id, "user", question)
+            save_message(session_id, "assistant", answer)
 
-    # ── 5: Build prompt messages ──────────────────────────────────────────────────
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
-        *history_messages,
-        {
-            "role": "user",
-            "content": (
-                f"CONTEXT (use only this to answer):\n"
-                f"---\n{context}\n---\n\n"
-                f"QUESTION: {question}"
-            ),
-        },
-    ]
+    # ── 6: Return structured result ───────────────────────────────────────────────
+    result = {
+        "answer":       answer,
+        "sources":      format_sources(chunks),
+        "context_used": len(chunks),
+        "cached":       False,
+        "tokens":       token_report(usage, llm_usage),
+    }
+    if not history:
+        _cache_store(query_vector, top_k, category_filter, result)
+    return result
 
-    # ── 6: Call Groq (fast + free) ────────────────────────────────────────────────
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=messages,
-        temperature=0.5,
-        max_tokens=800,
-    )
-    answer = response.choices[0].message.content
 
-    # ── 7: Save exchange to history ───────────────────────────────────────────────
+async def _retrieve_async(
+    question: str,
+    query_vector: List[float],
+    session_id: Optional[str],
+    top_k: int,
+    category_filter: Optional[str],
+    use_cache: bool,
+) -> Tuple[Optional[dict], List[dict], List[dict]]:
+    """
+    (cached answer, chunks, history). The answer cache only serves turns
+    without history, so when it may be consulted the history is read first
+    (usually from the in-memory ring buffer); otherwise chunks and history
+    are fetched concurrently (they don't depend on each other).
+    """
+    def search():
+        return timed("search", similarity_search_async(
+            query=question,
+            top_k=top_k,
+            category_filter=category_filter,
+            query_vector=query_vector,
+        ))
+
+    if session_id and not (ANSWER_CACHE_ENABLED and use_cache):
+        chunks, history = await asyncio.gather(
+            search(),
+            timed("history", get_history_async(session_id, limit=6)),
+        )
+        return None, chunks, history
+
+    history = await timed("history", get_history_async(session_id, limit=6)) if session_id else []
+    cached = None if history else _cache_lookup(query_vector, top_k, category_filter, use_cache)
+    if cached:
+        return cached, [], history
+    return None, await search(), history
+
+
+async def _save_exchange_async(session_id: Optional[str], question: str, answer: str):
     if session_id:
-        save_message(session_id, "user", question)
-        save_message(session_id, "assistant", answer)
+        # Sequential so the user turn is stored before the assistant turn
+        with stage_timer("persist"):
+            await save_message_async(session_id, "user", question)
+            await save_message_async(session_id, "assistant", answer)
 
-    # ── 8: Return structured result ───────────────────────────────────────────────
-    sources = [
-        {
-            "destination": c.get("destination", "Unknown"),
-            "source":      c.get("source", "Unknown"),
-            "similarity":  round(c.get("similarity", 0), 3),
-        }
-        for c in chunks
-    ]
 
-    return {
+@observe_pipeline("async")
+async def rag_answer_async(
+    question: str,
+    session_id: Optional[str] = None,
+    top_k: int = 5,
+    category_filter: Optional[str] = None,
+    use_cache: bool = True,
+) -> dict:
+    """
+    Same pipeline as rag_answer, but every upstream call (Cohere, Postgres, Groq)
+    is awaited, so a slow dependency never ties up a worker thread.
+    """
+    category_filter = normalize_filter(category_filter)
+    with stage_timer("embed"):
+        query_vector = await embedder.embed_query_async(question)
+
+    cached, chunks, history = await _retrieve_async(
+        question, query_vector, session_id, top_k, category_filter, use_cache,
+    )
+    if cached:
+        await _save_exchange_async(session_id, question, cached["answer"])
+        return cached
+
+    if not chunks:
+        return dict(NO_RESULTS_RESPONSE)
+
+    with stage_timer("prompt"):
+        messages, chunks, usage = build_messages(question, chunks, history)
+
+    with stage_timer("llm"):
+        response = await async_client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+        )
+    llm_usage = getattr(response, "usage", None)
+    record_llm_usage(llm_usage)
+    answer = response.choices[0].message.content
+
+    await _save_exchange_async(session_id, question, answer)
+
+    result = {
         "answer":       answer,
-        "sources":      sources,
+        "sources":      format_sources(chunks),
         "context_used": len(chunks),
+        "cached":       False,
+        "tokens":       token_report(usage, llm_usage),
     }
+    if not history:
+        _cache_store(query_vector, top_k, category_filter, result)
+    return result
+
+
+@observe_pipeline("stream")
+async def rag_answer_stream(
+    question: str,
+    session_id: Optional[str] = None,
+    top_k: int = 5,
+    category_filter: Optional[str] = None,
+    use_cache: bool = True,
+) -> AsyncIterator[dict]:
+    """
+    Streaming variant of rag_answer_async (backs /chat/stream).
+
+    Yields events in order:
+      {"event": "sources", "data": {"sources": [...], "context_used": n}}
+      {"event": "token",   "data": {"text": "..."}}     ← one per Groq delta
+      {"event": "done",    "data": {"answer": "...", "tokens": {...}}}
+
+    History is saved once the full answer has been generated.
+    """
+    category_filter = normalize_filter(category_filter)
+    with stage_timer("embed"):
+        query_vector = await embedder.embed_query_async(question)
+
+    cached, chunks, history = await _retrieve_async(
+        question, query_vector, session_id, top_k, category_filter, use_cache,
+    )
+    if cached:
+        yield {
+            "event": "sources",
+            "data":  {"sources": cached["sources"], "context_used": cached["context_used"], "cached": True},
+        }
+        yield {"event": "token", "data": {"text": cached["answer"]}}
+        await _save_exchange_async(session_id, question, cached["answer"])
+        yield {"event": "done", "data": {"answer": cached["answer"]}}
+        return
+
+    if not chunks:
+        yield {"event": "sources", "data": {"sources": [], "context_used": 0, "cached": False}}
+        answer = NO_RESULTS_RESPONSE["answer"]
+        yield {"event": "token", "data": {"text": answer}}
+        yield {"event": "done", "data": {"answer": answer}}
+        return
+
+    # Built before announcing sources, so they list only chunks that fit the budget
+    with stage_timer("prompt"):
+        messages, chunks, usage = build_messages(question, chunks, history)
+
+    sources = format_sources(chunks)
+    yield {
+        "event": "sources",
+        "data":  {"sources": sources, "context_used": len(chunks), "cached": False},
+    }
+
+    # Timed until the last delta arrives. The client's own consumption of each
+    # yielded token is included, which is negligible next to generation time.
+    parts, llm_usage = [], None
+    with stage_timer("llm"):
+        stream = await async_client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            stream=True,
+        )
+        async for chunk in stream:
+            # Groq reports usage on the final chunk under `x_groq`
+            x_groq = getattr(chunk, "x_groq", None)
+            chunk_usage = getattr(chunk, "usage", None) or getattr(x_groq, "usage", None)
+            if chunk_usage is not None:
+                llm_usage = chunk_usage
+                record_llm_usage(chunk_usage)
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                parts.append(text)
+                yield {"event": "token", "data": {"text": text}}
+
+    answer = "".join(parts)
+    tokens = token_report(usage, llm_usage)
+    await _save_exchange_async(session_id, question, answer)
+    if not history:
+        _cache_store(query_vector, top_k, category_filter, {
+            "answer":       answer,
+            "sources":      sources,
+            "context_used": len(chunks),
+            "cached":       False,
+            "tokens":       tokens,
+        })
+
+    yield {"event": "done", "data": {"answer": answer, "tokens": tokens}}
+
+
+# ── Retrieval only (no LLM) ──────────────────────────────────────────────────────
+@observe_pipeline("search")
+async def search_async(
+    queries: List[str],
+    top_k: int = 5,
+    category_filter: Optional[str] = None,
+    region_filter: Optional[str] = None,
+) -> dict:
+    """Ranked chunks with similarity scores for each query (one embed call, one DB round trip)."""
+    with stage_timer("embed"):
+        query_vectors = await embedder.embed_query_batch_async(queries)
+    with stage_timer("search"):
+        results = await batch_similarity_search_async(
+            queries, top_k, category_filter, region_filter, query_vectors=query_vectors,
+        )
+    return {"results": [{"query": q, "chunks": chunks} for q, chunks in zip(queries, results)]}
 
 
 # ── Pydantic models (used by FastAPI) ─────────────────────────────────────────────
@@ -160,11 +469,23 @@ class ChatRequest(BaseModel):
     message:         str
     session_id:      Optional[str] = "default"
     category_filter: Optional[str] = None   # e.g. "safari", "beach", "transport"
+    use_cache:       bool = True            # False = always generate a fresh answer
 
 class ChatResponse(BaseModel):
     answer:       str
     sources:      list
     context_used: int
+    cached:       bool = False
+    tokens:       Optional[dict] = None   # estimated prompt breakdown + Groq-reported usage
+
+class SearchRequest(BaseModel):
+    queries:         List[str] = Field(..., min_length=1, max_length=SEARCH_MAX_QUERIES)
+    top_k:           int = Field(5, ge=1, le=50)
+    category_filter: Optional[str] = None
+    region_filter:   Optional[str] = None
+
+class SearchResponse(BaseModel):
+    results: list   # [{"query": ..., "chunks": [{content, source, ..., similarity}]}], in query order
 
 
 # ── Quick test ────────────────────────────────────────────────────────────────────
@@ -8,35 +8,131 @@ Sources:
 - Manual curated data
 
 Run: python scrape_kenya_data.py
+     python scrape_kenya_data.py --urls urls.txt   # scrape, chunk and ingest pages
 """
 
-import requests
-from bs4 import BeautifulSoup
-from vector_store import add_documents_simple, get_document_count, clear_knowledge_base
+import argparse
 import time
+from typing import Dict, List, Optional
+
+from bs4 import BeautifulSoup
+from chunker import CHUNK_BATCH_SIZE, chunk_documents
+from fetcher import SCRAPE_WINDOW, Fetcher
+from vector_store import (
+    add_documents_simple,
+    clear_knowledge_base,
+    get_document_count,
+    replace_documents_by_source,
+    sources_with_documents,
+)
+
+# Shared so repeated calls reuse the same on-disk cache and stats
+fetcher = Fetcher()
+
+# Metadata for scraped pages unless the caller gives per-URL values
+DEFAULT_PAGE_METADATA = {"category": "general", "region": "General", "destination": "Kenya"}
 
-# ── Headers for web scraping ────────────────────────────────────────────────────
-HEADERS = {
-    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-}
+
+def extract_text(html: str) -> str:
+    """Visible text of an HTML page, without scripts, styles and page chrome."""
+    soup = BeautifulSoup(html, "html.parser")
+
+    # Remove script and style elements
+    for element in soup(["script", "style", "nav", "footer", "header"]):
+        element.decompose()
+
+    return soup.get_text(separator=" ", strip=True)
 
 
 def scrape_url(url: str) -> str:
-    """Fetch and extract text from a URL."""
-    try:
-        response = requests.get(url, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        # Remove script and style elements
-        for element in soup(["script", "style", "nav", "footer", "header"]):
-            element.decompose()
-        
-        text = soup.get_text(separator=" ", strip=True)
-        return text[:5000]  # Limit text length
-    except Exception as e:
-        print(f"Error scraping {url}: {e}")
-        return ""
+    """Fetch and extract text from a URL (conditional GET against the local cache)."""
+    page = fetcher.fetch_many([url])[0]
+    return extract_text(page["text"]) if page["text"] else ""
+
+
+def _fetch(urls: List[str]) -> List[dict]:
+    pages = fetcher.fetch_many(urls)
+    changed = sum(1 for page in pages if page["changed"])
+    failed = sum(1 for page in pages if page["error"])
+    print(f"Fetched {len(pages)} pages: {changed} changed, {len(pages) - changed} unchanged, {failed} failed")
+    return pages
+
+
+def scrape_urls(urls: List[str], changed_only: bool = False) -> Dict[str, str]:
+    """
+    Fetch many URLs concurrently and extract their text, keyed by URL.
+    With `changed_only`, pages unchanged since the last run are skipped.
+    """
+    return {
+        page["url"]: extract_text(page["text"])
+        for page in _fetch(urls)
+        if page["text"] and (page["changed"] or not changed_only)
+    }
+
+
+def ingest_urls(
+    urls: List[str],
+    metadata: Optional[Dict[str, dict]] = None,
+    changed_only: bool = True,
+    batch_size: int = CHUNK_BATCH_SIZE,
+    window: int = SCRAPE_WINDOW,
+) -> dict:
+    """
+    Scrape `urls`, chunk each page and embed/insert the chunks batch by batch.
+
+    Pages are streamed as they are fetched (at most `window` in flight), and
+    a batch holds whole pages of about `batch_size` chunks, so memory stays
+    bounded however many URLs there are.
+
+    Chunks are stored with source = page URL, and a page's new chunks replace
+    those an earlier run stored for it, in the same transaction and only
+    once they are embedded. A page's new body is cached only after its
+    chunks commit, so a page whose ingestion failed counts as changed on
+    the next run. `metadata` maps a URL to its
+    category/region/destination. With `changed_only`, pages unchanged since
+    the last fetch are skipped if their chunks are already stored; pass False
+    to rebuild them all.
+    """
+    start = time.perf_counter()
+    metadata = metadata or {}
+    counts = {"pages": 0, "chunks": 0, "batches": 0, "replaced": 0}
+    docs = {url: {**DEFAULT_PAGE_METADATA, "source": url, **metadata.get(url, {})} for url in urls}
+    stored = sources_with_documents([doc["source"] for doc in docs.values()]) if changed_only else set()
+    fetched = changed = failed = 0
+    batch: List[dict] = []
+    batch_pages: List[dict] = []
+
+    def flush():
+        result = replace_documents_by_source([chunk["content"] for chunk in batch], batch)
+        for page in batch_pages:
+            fetcher.save(page)
+        counts["chunks"] += result["inserted"]
+        counts["replaced"] += result["deleted"]
+        counts["batches"] += 1
+        batch.clear()
+        batch_pages.clear()
+        print(f"  Batch {counts['batches']}: {counts['chunks']} chunks from {counts['pages']} pages")
+
+    for page in fetcher.iter_pages(urls, window, defer_cache=True):
+        fetched += 1
+        changed += page["changed"]
+        failed += bool(page["error"])
+        doc = docs[page["url"]]
+        text = extract_text(page["text"]) if page["text"] else ""
+        if not text or (changed_only and not page["changed"] and doc["source"] in stored):
+            fetcher.save(page)   # nothing to ingest: cache it now
+            continue
+        counts["pages"] += 1
+        batch.extend(chunk_documents([{**doc, "content": text}]))
+        batch_pages.append(page)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    print(f"Fetched {fetched} pages: {changed} changed, {fetched - changed} unchanged, {failed} failed")
+    seconds = time.perf_counter() - start
+    return {**counts, "seconds": round(seconds, 2)}
 
 
 # ── Curated Kenya Travel Data ───────────────────────────────────────────────────
@@ -435,4 +531,14 @@ def populate_database():
 
 
 if __name__ == "__main__":
-    populate_database()
+    parser = argparse.ArgumentParser(description="Populate the Tembo AI knowledge base.")
+    parser.add_argument("--urls", help="file with one URL per line to scrape, chunk and ingest")
+    parser.add_argument("--all", action="store_true", help="re-ingest unchanged pages too")
+    args = parser.parse_args()
+
+    if args.urls:
+        with open(args.urls, encoding="utf-8") as f:
+            url_list = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        print(ingest_urls(url_list, changed_only=not args.all))
+    else:
+        populate_database()
@@ -16,9 +16,22 @@ CREATE TABLE IF NOT EXISTS documents (
     category    TEXT,                           -- 'safari', 'beach', 'transport', etc.
     region      TEXT,                           -- 'Coast', 'Rift Valley', 'Nairobi', etc.
     destination TEXT,                           -- e.g. 'Masai Mara', 'Diani Beach'
-    created_at  TIMESTAMPTZ DEFAULT NOW()
+    content_hash TEXT,                          -- sha256 of content + metadata (incremental sync)
+    embedding_model TEXT,                       -- embedder that produced the vector (see EMBEDDING_BACKEND)
+    corpus      TEXT,                           -- sync_documents corpus owning the row ('curated'); NULL = scraped/ad hoc
+    created_at  TIMESTAMPTZ DEFAULT NOW(),
+    -- full-text leg of hybrid search (destination weighted above body text)
+    search_tsv  TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(destination, '')), 'A') ||
+        setweight(to_tsvector('english', content), 'B')
+    ) STORED
 );
 
+CREATE INDEX IF NOT EXISTS documents_content_hash_idx
+    ON documents (content_hash);
+CREATE INDEX IF NOT EXISTS documents_corpus_idx
+    ON documents (corpus);
+
 -- 3. Create an HNSW index for fast approximate nearest-neighbour search
 --    HNSW is faster than IVFFlat for most use cases
 --    operator class: vector_cosine_ops (matches normalized embeddings)
@@ -27,6 +40,30 @@ CREATE INDEX IF NOT EXISTS documents_embedding_idx
     USING hnsw (embedding vector_cosine_ops)
     WITH (m = 16, ef_construction = 64);
 
+--    Optional, pgvector >= 0.7.0: a compact index instead (VECTOR_STORAGE=halfvec
+--    or binary); searches over-fetch from it and rescore on the float32 column.
+--    Apply with: python vector_store.py --migrate-storage halfvec --drop-unused
+-- CREATE INDEX IF NOT EXISTS documents_embedding_half_idx
+--     ON documents
+--     USING hnsw ((embedding::halfvec(384)) halfvec_cosine_ops)
+--     WITH (m = 16, ef_construction = 64);
+-- CREATE INDEX IF NOT EXISTS documents_embedding_bit_idx
+--     ON documents
+--     USING hnsw ((binary_quantize(embedding)::bit(384)) bit_hamming_ops)
+--     WITH (m = 16, ef_construction = 64);
+
+-- GIN index for the full-text leg of hybrid search
+CREATE INDEX IF NOT EXISTS documents_search_tsv_idx
+    ON documents
+    USING gin (search_tsv);
+
+-- B-tree indexes on the filter columns: small filtered subsets are ranked
+-- exactly (FILTER_EXACT_MAX_ROWS) instead of post-filtering the HNSW scan
+CREATE INDEX IF NOT EXISTS documents_category_region_idx
+    ON documents (category, region);
+CREATE INDEX IF NOT EXISTS documents_region_idx
+    ON documents (region);
+
 -- 4. Create chat history table (for conversation memory)
 CREATE TABLE IF NOT EXISTS chat_sessions (
     id          SERIAL PRIMARY KEY,
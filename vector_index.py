@@ -0,0 +1,203 @@
+"""
+vector_index.py
+In-process NumPy mirror of the `documents` table for Tembo AI.
+
+The corpus is a few thousand 384-dim vectors (~1.5 MB as float32), so it fits
+comfortably in RAM. Holding it in one contiguous matrix turns top-k retrieval
+into a single matrix-vector product and removes a DB round trip per chat turn.
+
+The mirror refreshes from Postgres using a cheap version stamp
+(row count + max id), checked at most once every `refresh_interval` seconds:
+  - new rows only  → fetch rows with id > last seen id and append
+  - anything else  → full reload (deletes, TRUNCATE ... RESTART IDENTITY)
+"""
+
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+import psycopg2.extras
+
+METADATA_COLUMNS = ("content", "source", "category", "region", "destination")
+
+
+class InMemoryVectorIndex:
+    """Contiguous float32 matrix of normalized embeddings plus metadata columns."""
+
+    def __init__(self, pool, refresh_interval: float = 30.0):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        self._checked_at = 0.0            # monotonic time of the last version check
+        self._stale = True
+        self._version: Tuple[int, int] = (0, 0)   # (row count, max id)
+
+        # Swapped in one assignment so searches always see a consistent snapshot
+        self._snapshot = self._empty_snapshot()
+
+    # ── Refresh ─────────────────────────────────────────────────────────────────
+
+    def mark_stale(self):
+        """Force a version check on the next search (e.g. after an in-process write)."""
+        self._stale = True
+
+    def refresh_due(self) -> bool:
+        return self._stale or time.monotonic() - self._checked_at >= self.refresh_interval
+
+    def refresh(self, force: bool = False):
+        """Sync with Postgres if the version stamp changed (incrementally when possible)."""
+        if not (force or self.refresh_due()):
+            return
+        with self._lock:
+            if not (force or self.refresh_due()):
+                return   # another thread refreshed while we waited for the lock
+
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM documents")
+                    count, max_id = cur.fetchone()
+
+                old_count, old_max_id = self._version
+                if force or (count, max_id) != self._version:
+                    if max_id >= old_max_id and count >= old_count and not force:
+                        new_rows = self._fetch_rows(conn, after_id=old_max_id)
+                        if old_count + len(new_rows) == count:
+                            self._append(new_rows)
+                        else:
+                            self._load(self._fetch_rows(conn, after_id=0))
+                    else:
+                        self._load(self._fetch_rows(conn, after_id=0))
+                    self._version = (count, max_id)
+
+            self._checked_at = time.monotonic()
+            self._stale = False
+
+    def _fetch_rows(self, conn, after_id: int) -> List[dict]:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(
+                f"""
+                SELECT id, {", ".join(METADATA_COLUMNS)}, embedding::real[] AS embedding
+                FROM documents
+                WHERE id > %s
+                ORDER BY id
+                """,
+                (after_id,),
+            )
+            return cur.fetchall()
+
+    def _load(self, rows: List[dict]):
+        self._snapshot = self._build_snapshot(rows)
+
+    def _append(self, rows: List[dict]):
+        if not rows:
+            return
+        old, new = self._snapshot, self._build_snapshot(rows)
+        if old["matrix"].shape[0] == 0:
+            self._snapshot = new
+            return
+        self._snapshot = {
+            "matrix": np.vstack([old["matrix"], new["matrix"]]),
+            "ids":    np.concatenate([old["ids"], new["ids"]]),
+            **{col: np.concatenate([old[col], new[col]]) for col in METADATA_COLUMNS},
+        }
+
+    @staticmethod
+    def _build_snapshot(rows: List[dict]) -> dict:
+        if not rows:
+            return InMemoryVectorIndex._empty_snapshot()
+        matrix = np.asarray([r["embedding"] for r in rows], dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        snapshot = {
+            "matrix": np.ascontiguousarray(matrix),
+            "ids":    np.asarray([r["id"] for r in rows], dtype=np.int64),
+        }
+        for col in METADATA_COLUMNS:
+            column = np.empty(len(rows), dtype=object)
+            column[:] = [r[col] for r in rows]
+            snapshot[col] = column
+        return snapshot
+
+    @staticmethod
+    def _empty_snapshot() -> dict:
+        snapshot = {
+            "matrix": np.zeros((0, 0), dtype=np.float32),
+            "ids":    np.zeros(0, dtype=np.int64),
+        }
+        for col in METADATA_COLUMNS:
+            snapshot[col] = np.empty(0, dtype=object)
+        return snapshot
+
+    # ── Search ──────────────────────────────────────────────────────────────────
+
+    def search(
+        self,
+        query_vector: List[float],
+        top_k: int = 5,
+        category_filter: Optional[str] = None,
+        region_filter: Optional[str] = None,
+        with_embeddings: bool = False,
+    ) -> List[dict]:
+        """
+        Top-k by cosine similarity, with category/region applied as boolean masks.
+        Returns the same dicts as vector_store.similarity_search (plus each
+        row's normalized "embedding" if `with_embeddings`).
+        """
+        return self.search_many([query_vector], top_k, category_filter, region_filter, with_embeddings)[0]
+
+    def search_many(
+        self,
+        query_vectors: List[List[float]],
+        top_k: int = 5,
+        category_filter: Optional[str] = None,
+        region_filter: Optional[str] = None,
+        with_embeddings: bool = False,
+    ) -> List[List[dict]]:
+        """
+        search() for many queries at once: one matrix-matrix product scores
+        every query against every row. Results are in query order.
+        """
+        snap = self._snapshot
+        if snap["matrix"].shape[0] == 0 or top_k <= 0 or not len(query_vectors):
+            return [[] for _ in query_vectors]
+
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        sims = queries @ snap["matrix"].T          # (queries, rows)
+        mask = np.zeros(sims.shape[1], dtype=bool)
+        if category_filter:
+            mask |= snap["category"] != category_filter
+        if region_filter:
+            mask |= snap["region"] != region_filter
+        sims[:, mask] = -np.inf
+
+        k = min(top_k, sims.shape[1])
+        tops = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+
+        results = []
+        for row, top in zip(sims, tops):
+            top = top[np.argsort(-row[top])]
+            top = top[np.isfinite(row[top])]
+            hits = [
+                {**{col: snap[col][i] for col in METADATA_COLUMNS}, "similarity": float(row[i])}
+                for i in top
+            ]
+            if with_embeddings:
+                for hit, i in zip(hits, top):
+                    hit["embedding"] = snap["matrix"][i]
+            results.append(hits)
+        return results
+
+    def stats(self) -> dict:
+        snap = self._snapshot
+        return {
+            "rows":           int(snap["matrix"].shape[0]),
+            "dimension":      int(snap["matrix"].shape[1]) if snap["matrix"].ndim == 2 else 0,
+            "matrix_mb":      round(snap["matrix"].nbytes / 1e6, 3),
+            "version":        {"count": self._version[0], "max_id": self._version[1]},
+            "seconds_since_check": round(time.monotonic() - self._checked_at, 1) if self._checked_at else None,
+        }
@@ -5,13 +5,32 @@ PostgreSQL + pgvector vector store for Tembo AI.
 Replaces ChromaDB. Uses local embeddings — zero API cost.
 """
 
+import asyncio
+import csv
+import hashlib
+import io
+import math
 import os
+import struct
+import time
+import numpy as np
 import psycopg2
 import psycopg2.extras
-from typing import List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 from dotenv import load_dotenv
+from psycopg.adapt import Dumper, Loader
+from psycopg.conninfo import make_conninfo
+from psycopg.pq import Format
+from psycopg.rows import dict_row
+from psycopg.types import TypeInfo
+from psycopg_pool import AsyncConnectionPool
+from cache import SessionHistoryCache
+from db_pool import ConnectionPool
 from embeddings import embedder
+from history_writer import HistoryWriter
+from mmr import mmr_select
+from vector_index import InMemoryVectorIndex
 
 load_dotenv()
 
@@ -46,209 +65,1373 @@ def get_connection():
     return psycopg2.connect(**DB_CONFIG)
 
 
+# ── Connection pool ─────────────────────────────────────────────────────────────
+# Every helper below borrows from this pool instead of opening its own connection.
+pool = ConnectionPool(
+    get_connection,
+    min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+    max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+    max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+    check_interval=float(os.getenv("DB_POOL_CHECK_INTERVAL", "30")),
+)
+
+
+def get_pool_stats() -> dict:
+    """Pool size and checkout wait times (exposed on /health)."""
+    return pool.stats()
+
+
+# ── Vector parameters ───────────────────────────────────────────────────────────
+# Query vectors are bound as Vector, never str(list): psycopg 3 sends pgvector's
+# binary layout (int16 dim, int16 unused, dim big-endian float4s — 1.5 KB for
+# 384 dims, nothing for the server to parse), psycopg2 (text protocol only) a
+# literal with float4 precision instead of float64 reprs.
+
+class Vector:
+    """A query vector bound as a pgvector `vector` parameter."""
+
+    __slots__ = ("values",)
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float32)
+
+    def to_text(self) -> str:
+        # 9 significant digits round-trip any float4
+        return "[" + ",".join(f"{x:.9g}" for x in self.values.tolist()) + "]"
+
+    def to_binary(self) -> bytes:
+        return struct.pack("!hh", self.values.shape[0], 0) + self.values.astype(">f4").tobytes()
+
+
+psycopg2.extensions.register_adapter(
+    Vector, lambda v: psycopg2.extensions.AsIs(f"'{v.to_text()}'::vector")
+)
+
+
+class _VectorTextDumper(Dumper):
+    # oid 0: the server infers the type from the ::vector cast next to it
+    def dump(self, obj: Vector) -> bytes:
+        return obj.to_text().encode()
+
+
+class _VectorBinaryDumper(Dumper):
+    format = Format.BINARY
+
+    def dump(self, obj: Vector) -> bytes:
+        return obj.to_binary()
+
+
+class _VectorBinaryLoader(Loader):
+    # Result columns of type vector, when a query asks for binary results
+    format = Format.BINARY
+
+    def load(self, data) -> np.ndarray:
+        return np.frombuffer(data, dtype=">f4", offset=4).astype(np.float32)
+
+
+def _embedding_array(value) -> np.ndarray:
+    """An `embedding` column as float32: psycopg2 returns pgvector's '[x,y,...]' text."""
+    if isinstance(value, str):
+        return np.array(value[1:-1].split(","), dtype=np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+async def _configure_async_connection(conn):
+    """Per new pooled connection: Vector in binary (both ways) once the vector type's oid is known."""
+    conn.adapters.register_dumper(Vector, _VectorTextDumper)
+    info = await TypeInfo.fetch(conn, "vector")
+    if info is not None:
+        info.register(conn)   # so lists of Vector dump as vector[]
+        conn.adapters.register_dumper(
+            Vector, type("VectorBinaryDumper", (_VectorBinaryDumper,), {"oid": info.oid})
+        )
+        conn.adapters.register_loader(info.oid, _VectorBinaryLoader)
+    await conn.commit()
+
+
+# ── Async connection pool ───────────────────────────────────────────────────────
+# The /chat path runs on the event loop, so it uses psycopg 3's async driver.
+# Same %s placeholders as psycopg2, so the SQL below is shared by both paths.
+# prepare_threshold=None keeps it compatible with Supabase's transaction pooler.
+_async_pool: Optional[AsyncConnectionPool] = None
+
+
+def _new_async_pool() -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        make_conninfo(**{k: str(v) for k, v in DB_CONFIG.items() if v is not None}),
+        min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+        max_size=int(os.getenv("DB_ASYNC_POOL_MAX_SIZE", "20")),
+        timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+        max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+        kwargs={"row_factory": dict_row, "prepare_threshold": None},
+        configure=_configure_async_connection,
+        open=False,
+    )
+
+
+async def open_async_pool() -> AsyncConnectionPool:
+    """Open the async pool (called from the FastAPI lifespan, or lazily on first use)."""
+    global _async_pool
+    if _async_pool is None or _async_pool.closed:
+        # psycopg pools can't be reopened once closed, so build a fresh one
+        _async_pool = _new_async_pool()
+        await _async_pool.open()
+    return _async_pool
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+
+
+def get_async_pool_stats() -> dict:
+    """Async pool stats, including requests_wait_ms for checkout waits."""
+    return _async_pool.get_stats() if _async_pool is not None else {}
+
+
+# ── Retrieval backend ───────────────────────────────────────────────────────────
+# "pgvector" (default) runs every search in Postgres. "numpy" answers searches
+# from an in-process mirror of the documents table and only goes to Postgres
+# to check its version stamp (at most every VECTOR_INDEX_REFRESH_INTERVAL seconds).
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "pgvector").lower()
+
+memory_index = InMemoryVectorIndex(
+    pool,
+    refresh_interval=float(os.getenv("VECTOR_INDEX_REFRESH_INTERVAL", "30")),
+)
+
+
+def use_memory_index() -> bool:
+    return RETRIEVAL_BACKEND == "numpy"
+
+
+# ── Change notifications ────────────────────────────────────────────────────────
+# Caches built on top of the knowledge base (e.g. the answer cache in rag.py)
+# register here so they are invalidated whenever documents change.
+_change_listeners: List[Callable[[], None]] = []
+
+
+def on_knowledge_base_change(callback: Callable[[], None]):
+    """Register a callback to run after documents are added or cleared."""
+    _change_listeners.append(callback)
+
+
+def _notify_change():
+    for callback in _change_listeners:
+        callback()
+
+
+on_knowledge_base_change(memory_index.mark_stale)
+
+
+# ── Schema migrations ───────────────────────────────────────────────────────────
+# DDL that brings databases created from an older setup_vector.py up to date.
+# It only runs from migrate_schema() — the FastAPI lifespan (DB_MIGRATE_ON_STARTUP),
+# ingestion jobs and `python vector_store.py --migrate` — never on the search
+# path: adding a STORED generated column rewrites the table under an ACCESS
+# EXCLUSIVE lock, and read-only roles can't run DDL at all. Each step is keyed
+# by the column or index it creates, so applied steps are skipped without
+# taking any lock.
+SCHEMA_MIGRATIONS = [
+    ("content_hash", "ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT"),
+    ("documents_content_hash_idx", "CREATE INDEX IF NOT EXISTS documents_content_hash_idx ON documents (content_hash)"),
+    # Full-text leg of hybrid search; destination names weigh more than body text
+    ("search_tsv", """
+    ALTER TABLE documents ADD COLUMN IF NOT EXISTS search_tsv tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(destination, '')), 'A') ||
+            setweight(to_tsvector('english', content), 'B')
+        ) STORED
+    """),
+    ("documents_search_tsv_idx", "CREATE INDEX IF NOT EXISTS documents_search_tsv_idx ON documents USING gin (search_tsv)"),
+    # Which embedder produced each vector, so switching EMBEDDING_BACKEND re-embeds
+    ("embedding_model", "ALTER TABLE documents ADD COLUMN IF NOT EXISTS embedding_model TEXT"),
+    # Which sync_documents corpus owns a row (NULL: scraped pages, ad-hoc loads)
+    ("corpus", "ALTER TABLE documents ADD COLUMN IF NOT EXISTS corpus TEXT"),
+    ("documents_corpus_idx", "CREATE INDEX IF NOT EXISTS documents_corpus_idx ON documents (corpus)"),
+    # Filter columns, for exact search over small filtered subsets
+    ("documents_category_region_idx",
+     "CREATE INDEX IF NOT EXISTS documents_category_region_idx ON documents (category, region)"),
+    ("documents_region_idx", "CREATE INDEX IF NOT EXISTS documents_region_idx ON documents (region)"),
+]
+
+# Seconds the read path trusts its cached view of the catalog (columns,
+# indexes, pgvector version) before reading it again
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", "300"))
+# Apply pending migrations in the FastAPI lifespan; turn off for read-only roles
+MIGRATE_ON_STARTUP    = os.getenv("DB_MIGRATE_ON_STARTUP", "true").lower() == "true"
+
+# Rows written before embedding_model existed were all embedded by Cohere
+LEGACY_EMBEDDING_MODEL = "embed-english-light-v3.0"
+
+# ── Vector storage ──────────────────────────────────────────────────────────────
+# "full" (default): HNSW over the float32 column.
+# "halfvec": HNSW over embedding::halfvec — half the index size.
+# "binary": HNSW over binary_quantize(embedding) — 1 bit per dimension,
+#           32x smaller, Hamming distance.
+# The float32 column stays the source of truth: quantized modes over-fetch
+# VECTOR_OVERFETCH × top_k candidates from the compact index and rescore them
+# by exact cosine distance. Both need pgvector >= 0.7.0.
+# Compact indexes are only built by migrate_vector_storage() (CREATE INDEX
+# CONCURRENTLY, `python vector_store.py --migrate-storage MODE`); searches use
+# VECTOR_STORAGE once its index exists, and otherwise whichever vector index
+# the database has.
+VECTOR_STORAGE   = os.getenv("VECTOR_STORAGE", "full").lower()
+VECTOR_OVERFETCH = int(os.getenv("VECTOR_OVERFETCH", "4"))
+QUANTIZED_MIN_PGVECTOR = (0, 7, 0)
+
+VECTOR_INDEXES = {
+    "full": (
+        "documents_embedding_idx",
+        "USING hnsw (embedding vector_cosine_ops)",
+    ),
+    "halfvec": (
+        "documents_embedding_half_idx",
+        f"USING hnsw ((embedding::halfvec({embedder.dimension})) halfvec_cosine_ops)",
+    ),
+    "binary": (
+        "documents_embedding_bit_idx",
+        f"USING hnsw ((binary_quantize(embedding)::bit({embedder.dimension})) bit_hamming_ops)",
+    ),
+}
+HNSW_BUILD_OPTIONS = "WITH (m = 16, ef_construction = 64)"
+
+_schema_columns: frozenset = frozenset()
+_schema_indexes: frozenset = frozenset()    # valid indexes on documents
+_schema_checked_at = 0.0                    # monotonic; 0 = never read
+_schema_migrated = False                    # migrate_schema() ran in this process
+_pgvector_version: Tuple[int, ...] = (0,)
+_vector_storage = "full"
+
+
+def _read_pgvector_version(cur) -> Tuple[int, ...]:
+    cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+    row = cur.fetchone()
+    return tuple(int(part) for part in row[0].split(".")) if row else (0,)
+
+
+def _read_catalog(cur) -> Tuple[frozenset, frozenset]:
+    """(column names, valid index names) of the documents table; catalog reads only."""
+    cur.execute(
+        """
+        SELECT
+            ARRAY(
+                SELECT attname FROM pg_attribute
+                WHERE attrelid = to_regclass('documents') AND attnum > 0 AND NOT attisdropped
+            ),
+            ARRAY(
+                SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = to_regclass('documents') AND i.indisvalid
+            )
+        """
+    )
+    columns, indexes = cur.fetchone()
+    return frozenset(columns), frozenset(indexes)
+
+
+def _vector_index_sql(storage: str) -> str:
+    name, method = VECTOR_INDEXES[storage]
+    return f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON documents {method} {HNSW_BUILD_OPTIONS}"
+
+
+def _select_storage(indexes: frozenset, version: Tuple[int, ...], warn: bool = True) -> str:
+    """VECTOR_STORAGE if its index is built, else the first vector index that exists."""
+    usable = [
+        storage for storage, (name, _) in VECTOR_INDEXES.items()
+        if name in indexes and (storage == "full" or version >= QUANTIZED_MIN_PGVECTOR)
+    ]
+    if VECTOR_STORAGE in usable:
+        return VECTOR_STORAGE
+    storage = usable[0] if usable else "full"
+    if warn and VECTOR_STORAGE != storage:
+        print(
+            f"VECTOR_STORAGE={VECTOR_STORAGE} has no index yet "
+            f"(run `python vector_store.py --migrate-storage {VECTOR_STORAGE}`); searching with '{storage}'"
+        )
+    return storage
+
+
+def refresh_schema_state():
+    """Re-read columns, indexes and the pgvector version. Never runs DDL."""
+    global _schema_columns, _schema_indexes, _schema_checked_at, _pgvector_version, _vector_storage
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            columns, indexes = _read_catalog(cur)
+            version = _read_pgvector_version(cur)
+        conn.commit()
+    if SEARCH_MODE == "hybrid" and "search_tsv" not in columns and (not _schema_checked_at or "search_tsv" in _schema_columns):
+        print("documents.search_tsv is missing (run `python vector_store.py --migrate`); using vector search")
+    _schema_columns, _schema_indexes, _pgvector_version = columns, indexes, version
+    _vector_storage = _select_storage(indexes, version, warn=not _schema_checked_at)
+    _schema_checked_at = time.monotonic()
+
+
+def _schema_due() -> bool:
+    return not _schema_checked_at or time.monotonic() - _schema_checked_at >= SCHEMA_CHECK_INTERVAL
+
+
+def ensure_schema():
+    """Make sure the read path's view of the schema is loaded (cheap: catalog reads, cached)."""
+    if _schema_due():
+        refresh_schema_state()
+
+
+def migrate_schema():
+    """
+    Apply the SCHEMA_MIGRATIONS steps that are missing. For setup, jobs and
+    the CLI — not the search path.
+    """
+    global _schema_migrated
+    if _schema_migrated:
+        return
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            columns, indexes = _read_catalog(cur)
+            missing = [(name, sql) for name, sql in SCHEMA_MIGRATIONS if name not in columns | indexes]
+            for name, sql in missing:
+                print(f"Schema migration: {name}")
+                cur.execute(sql)
+        conn.commit()
+    _schema_migrated = True
+    refresh_schema_state()
+
+
+def active_vector_storage() -> str:
+    """The storage mode searches use: VECTOR_STORAGE if its index exists, else an index that does."""
+    return _vector_storage
+
+
+def migrate_vector_storage(storage: str = VECTOR_STORAGE, drop_unused: bool = False) -> dict:
+    """
+    Build the HNSW index for `storage` over the existing rows and, with
+    `drop_unused`, drop the other vector indexes (the float32 HNSW index is
+    what costs the space). Returns index sizes in bytes afterwards.
+
+    Runs CONCURRENTLY on its own autocommit connection, so searches and
+    writes carry on during the build. A build interrupted earlier leaves an
+    invalid index behind; it is dropped and rebuilt.
+    """
+    if storage not in VECTOR_INDEXES:
+        raise ValueError(f"Unknown VECTOR_STORAGE={storage!r}; choose one of {', '.join(VECTOR_INDEXES)}")
+    name = VECTOR_INDEXES[storage][0]
+    conn = get_connection()
+    try:
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            version = _read_pgvector_version(cur)
+            if storage != "full" and version < QUANTIZED_MIN_PGVECTOR:
+                raise RuntimeError(
+                    f"{storage} storage needs pgvector >= 0.7.0 (server has {'.'.join(map(str, version))})"
+                )
+            cur.execute(
+                """
+                SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = %s AND NOT i.indisvalid
+                """,
+                (name,),
+            )
+            if cur.fetchone():
+                print(f"Dropping invalid index {name} left by an interrupted build")
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            start = time.perf_counter()
+            cur.execute(_vector_index_sql(storage))
+            built = time.perf_counter() - start
+            if drop_unused:
+                for other, (other_name, _) in VECTOR_INDEXES.items():
+                    if other != storage:
+                        cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {other_name}")
+    finally:
+        conn.close()
+    refresh_schema_state()
+    print(f"Vector storage '{storage}' ready in {built:.1f}s")
+    return {"storage": storage, "build_seconds": round(built, 2), "index_bytes": vector_index_sizes()}
+
+
+def vector_index_sizes() -> dict:
+    """On-disk size of each vector index that exists, by storage mode."""
+    names = {name: storage for storage, (name, _) in VECTOR_INDEXES.items()}
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT relname, pg_relation_size(oid) FROM pg_class WHERE relname = ANY(%s)",
+                (list(names),),
+            )
+            return {names[name]: size for name, size in cur.fetchall()}
+
+
+def document_hash(
+    content: str,
+    source: Optional[str] = None,
+    category: Optional[str] = None,
+    region: Optional[str] = None,
+    destination: Optional[str] = None,
+) -> str:
+    """SHA-256 of a document's content and metadata — identifies it across syncs."""
+    parts = [content, source, category, region, destination]
+    return hashlib.sha256("\x1f".join(p or "" for p in parts).encode("utf-8")).hexdigest()
+
+
 # ── Write: Add documents to the knowledge base ─────────────────────────────────
 
+DOCUMENT_COLUMNS = (
+    "(content, embedding, source, category, region, destination, content_hash, embedding_model, corpus)"
+)
+
+# PGCOPY binary format: signature, flags (int32), header extension length (int32)
+_COPY_HEADER  = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_COPY_TRAILER = struct.pack("!h", -1)
+
+
+def _copy_binary_rows(rows: List[tuple]) -> bytes:
+    """
+    Encode (content, vector, source, category, region, destination, hash, model, corpus) rows in
+    PostgreSQL's binary COPY format. Vectors use pgvector's binary layout:
+    int16 dim, int16 unused, then dim big-endian float4s.
+    """
+    buf = io.BytesIO()
+    buf.write(_COPY_HEADER)
+    for row in rows:
+        buf.write(struct.pack("!h", len(row)))
+        for i, value in enumerate(row):
+            if value is None:
+                buf.write(struct.pack("!i", -1))
+            elif i == 1:
+                vec = np.asarray(value, dtype=">f4")
+                buf.write(struct.pack("!ihh", 4 + vec.nbytes, vec.shape[0], 0))
+                buf.write(vec.tobytes())
+            else:
+                data = str(value).encode("utf-8")
+                buf.write(struct.pack("!i", len(data)))
+                buf.write(data)
+    buf.write(_COPY_TRAILER)
+    return buf.getvalue()
+
+
+def _copy_csv_rows(rows: List[tuple]) -> str:
+    """Text fallback: CSV with vectors in pgvector's '[x,y,...]' literal form."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for content, vector, *meta in rows:
+        writer.writerow([content, Vector(vector).to_text(), *meta])
+    return buf.getvalue()
+
+
+def _copy_documents(conn, rows: List[tuple]):
+    """Bulk-load rows with COPY FROM STDIN — binary first, CSV if the server rejects it."""
+    try:
+        with conn.cursor() as cur:
+            cur.copy_expert(
+                f"COPY documents {DOCUMENT_COLUMNS} FROM STDIN WITH (FORMAT binary)",
+                io.BytesIO(_copy_binary_rows(rows)),
+            )
+    except psycopg2.Error as e:
+        print(f"Binary COPY failed ({e.pgerror or e}), retrying as CSV...")
+        conn.rollback()
+        with conn.cursor() as cur:
+            # Empty unquoted CSV fields load as NULL, matching the binary path
+            cur.copy_expert(
+                f"COPY documents {DOCUMENT_COLUMNS} FROM STDIN WITH (FORMAT csv)",
+                io.StringIO(_copy_csv_rows(rows)),
+            )
+
+
+def _embed_rows(texts: List[str], metadatas: List[dict], corpus: Optional[str] = None) -> List[tuple]:
+    """Embed `texts` into rows ready for _write_documents (no database access)."""
+    print(f"Embedding {len(texts)} documents...")
+    vectors = embedder.embed_batch(texts)
+    rows = []
+    for text, vector, m in zip(texts, vectors, metadatas):
+        meta = (m.get("source"), m.get("category"), m.get("region"), m.get("destination"))
+        rows.append((text, vector, *meta, document_hash(text, *meta), embedder.model, corpus))
+    return rows
+
+
+def _write_documents(
+    rows: List[tuple],
+    delete_ids: Optional[List[int]] = None,
+    delete_sources: Optional[List[str]] = None,
+    claim_ids: Optional[List[int]] = None,
+    corpus: Optional[str] = None,
+) -> Tuple[int, int]:
+    """
+    In one transaction: delete rows by id and/or source, tag `claim_ids` with
+    `corpus`, and COPY the already-embedded `rows`. Either all of it is
+    visible or none of it, so a failure never leaves documents missing.
+    Returns (rows inserted, rows deleted).
+    """
+    migrate_schema()
+    start = time.perf_counter()
+    deleted = 0
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            if delete_ids:
+                cur.execute("DELETE FROM documents WHERE id = ANY(%s)", (delete_ids,))
+                deleted += cur.rowcount
+            if delete_sources:
+                cur.execute("DELETE FROM documents WHERE source = ANY(%s)", (delete_sources,))
+                deleted += cur.rowcount
+            if claim_ids:
+                cur.execute("UPDATE documents SET corpus = %s WHERE id = ANY(%s)", (corpus, claim_ids))
+        if rows:
+            _copy_documents(conn, rows)
+        conn.commit()
+    n = len(rows)
+    if n:
+        elapsed = time.perf_counter() - start
+        print(f"Inserted {n} documents into PostgreSQL in {elapsed:.2f}s ({n / max(elapsed, 1e-9):,.0f} rows/sec).")
+    if rows or deleted:
+        _notify_change()
+    return n, deleted
+
+
 def add_documents(
     texts: List[str],
     sources: Optional[List[str]] = None,
     categories: Optional[List[str]] = None,
     regions: Optional[List[str]] = None,
     destinations: Optional[List[str]] = None,
+    corpus: Optional[str] = None,
 ) -> int:
     """
     Embed and store a list of text chunks in PostgreSQL.
+    The whole batch is written with one COPY in a single transaction.
     Returns the number of documents inserted.
     """
     if not texts:
         return 0
 
-    print(f"Embedding {len(texts)} documents locally...")
-    vectors = embedder.embed_batch(texts)
+    n = len(texts)
+    metadatas = [
+        {"source": source, "category": category, "region": region, "destination": destination}
+        for source, category, region, destination in zip(
+            sources or [None] * n,
+            categories or [None] * n,
+            regions or [None] * n,
+            destinations or [None] * n,
+        )
+    ]
+    return _write_documents(_embed_rows(texts, metadatas, corpus))[0]
 
-    rows = []
-    for i, (text, vector) in enumerate(zip(texts, vectors)):
-        rows.append((
-            text,
-            vector,
-            (sources or [None] * len(texts))[i],
-            (categories or [None] * len(texts))[i],
-            (regions or [None] * len(texts))[i],
-            (destinations or [None] * len(texts))[i],
-        ))
 
-    conn = get_connection()
-    try:
+def add_documents_simple(
+    texts: List[str],
+    metadatas: Optional[List[dict]] = None,
+    corpus: Optional[str] = None,
+) -> int:
+    """
+    Simpler version — pass texts and optional metadata dicts.
+    Each metadata dict can have: source, category, region, destination
+    """
+    if not texts:
+        return 0
+    if metadatas is None:
+        metadatas = [{} for _ in texts]
+    return _write_documents(_embed_rows(texts, metadatas, corpus))[0]
+
+
+def replace_documents_by_source(texts: List[str], metadatas: List[dict]) -> dict:
+    """
+    Store `texts` in place of every existing document from their sources
+    (metadata "source"), e.g. the new chunks of re-scraped pages. Embeds
+    first, then deletes and inserts in one transaction, so a failed embed or
+    write leaves the old chunks in place.
+    """
+    if not texts:
+        return {"inserted": 0, "deleted": 0}
+    sources = sorted({meta.get("source") for meta in metadatas} - {None})
+    inserted, deleted = _write_documents(_embed_rows(texts, metadatas), delete_sources=sources)
+    return {"inserted": inserted, "deleted": deleted}
+
+
+def sources_with_documents(sources: List[str]) -> set:
+    """The subset of `sources` that has at least one document stored."""
+    if not sources:
+        return set()
+    with pool.connection() as conn:
         with conn.cursor() as cur:
-            # Register the vector type so psycopg2 can serialize it
-            psycopg2.extras.register_default_jsonb(conn)
-
-            insert_sql = """
-                INSERT INTO documents (content, embedding, source, category, region, destination)
-                VALUES %s
-            """
-            # Build value tuples with vector cast
-            values = [
-                cur.mogrify("(%s, %s::vector, %s, %s, %s, %s)", row).decode()
-                for row in rows
-            ]
-            cur.execute(insert_sql.replace("%s", ",".join(values)).replace("VALUES ,", "VALUES "))
-
-            # Simpler approach that always works:
-            for row in rows:
-                cur.execute(
-                    """
-                    INSERT INTO documents (content, embedding, source, category, region, destination)
-                    VALUES (%s, %s::vector, %s, %s, %s, %s)
-                    """,
-                    (row[0], str(row[1]), row[2], row[3], row[4], row[5])
-                )
+            cur.execute("SELECT DISTINCT source FROM documents WHERE source = ANY(%s)", (list(sources),))
+            return {row[0] for row in cur.fetchall()}
+
+
+def _backfill_hashes(conn):
+    """Hash rows inserted before content_hash existed, so they aren't re-embedded."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT id, content, source, category, region, destination "
+            "FROM documents WHERE content_hash IS NULL"
+        )
+        rows = cur.fetchall()
+        if rows:
+            psycopg2.extras.execute_values(
+                cur,
+                "UPDATE documents SET content_hash = v.hash FROM (VALUES %s) AS v(id, hash) "
+                "WHERE documents.id = v.id",
+                [(row[0], document_hash(*row[1:])) for row in rows],
+            )
+    return len(rows)
+
+
+# Called after each ingestion batch as progress(batches_done, batches_total, docs_done, docs_total)
+ProgressCallback = Callable[[int, int, int, int], None]
+
+
+# sync_documents() owns only the rows tagged with its corpus
+CURATED_CORPUS = "curated"
 
+
+def sync_documents(
+    docs: List[dict],
+    batch_size: int = 500,
+    progress: Optional[ProgressCallback] = None,
+    corpus: str = CURATED_CORPUS,
+) -> dict:
+    """
+    Make the documents of `corpus` match `docs` (dicts with content + metadata).
+
+    Diffs by content hash: only new or changed documents are embedded and
+    inserted, and rows no longer in `docs` are deleted. Embedding calls scale
+    with the size of the diff, not the corpus. Rows embedded by a different
+    model than the current EMBEDDING_BACKEND's count as changed.
+
+    Only rows tagged with `corpus` are diffed, plus untagged rows with a
+    document's exact hash (loaded before tagging; they are claimed). Scraped
+    chunks and other untagged rows are never touched. Everything is embedded
+    first and the deletes and inserts commit together, so a failed embed
+    leaves the table as it was.
+    """
+    migrate_schema()
+
+    wanted = {}
+    for doc in docs:
+        meta = [doc.get("source"), doc.get("category"), doc.get("region"), doc.get("destination")]
+        wanted.setdefault(document_hash(doc["content"], *meta), doc)
+
+    with pool.connection() as conn:
+        backfilled = _backfill_hashes(conn)
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT id, content_hash, COALESCE(embedding_model, %s), corpus
+                FROM documents
+                WHERE corpus = %s OR (corpus IS NULL AND content_hash = ANY(%s))
+                ORDER BY id
+                """,
+                (LEGACY_EMBEDDING_MODEL, corpus, list(wanted)),
+            )
+            existing = cur.fetchall()
         conn.commit()
-        print(f"Inserted {len(texts)} documents into PostgreSQL.")
-        return len(texts)
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+
+    seen = set()
+    stale_ids, claim_ids = [], []
+    for doc_id, doc_hash, model, tag in existing:
+        if doc_hash in wanted and doc_hash not in seen and model == embedder.model:
+            seen.add(doc_hash)
+            if tag is None:
+                claim_ids.append(doc_id)
+        else:
+            stale_ids.append(doc_id)   # removed/changed upstream, a duplicate, or another embedder's vector
+
+    to_add = [doc for doc_hash, doc in wanted.items() if doc_hash not in seen]
+    batches = (len(to_add) + batch_size - 1) // batch_size
+    rows = []
+    if progress:
+        progress(0, batches, 0, len(to_add))
+    for i in range(0, len(to_add), batch_size):
+        batch = to_add[i:i + batch_size]
+        rows += _embed_rows([doc["content"] for doc in batch], batch, corpus)
+        if progress:
+            progress(i // batch_size + 1, batches, len(rows), len(to_add))
+
+    added, _ = _write_documents(rows, delete_ids=stale_ids, claim_ids=claim_ids, corpus=corpus)
+
+    result = {
+        "added":      added,
+        "deleted":    len(stale_ids),
+        "unchanged":  len(seen),
+        "backfilled": backfilled,
+    }
+    print(f"Sync complete: {result}")
+    return result
 
 
-def add_documents_simple(texts: List[str], metadatas: Optional[List[dict]] = None) -> int:
+# ── Read: Semantic search ───────────────────────────────────────────────────────
+# "hybrid" (default) fuses a vector leg and a full-text leg with reciprocal-rank
+# fusion, so exact names ("Hell's Gate", "SGR fare") rank even when their
+# embedding is a weak match. "vector" ranks by cosine distance alone.
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid").lower()
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))   # rows taken from each leg
+RRF_K = int(os.getenv("RRF_K", "60"))                           # standard RRF damping constant
+
+
+def use_hybrid_search() -> bool:
+    # Until search_tsv is migrated in, hybrid mode falls back to vector search
+    return SEARCH_MODE == "hybrid" and "search_tsv" in _schema_columns
+
+
+def _compact_distance(vector: str, storage: str) -> str:
+    """Distance expression the storage mode's index can serve."""
+    if storage == "halfvec":
+        return f"embedding::halfvec({embedder.dimension}) <=> ({vector})::halfvec({embedder.dimension})"
+    if storage == "binary":
+        return (
+            f"binary_quantize(embedding)::bit({embedder.dimension}) "
+            f"<~> binary_quantize({vector})::bit({embedder.dimension})"
+        )
+    return f"embedding <=> {vector}"
+
+
+def _nearest_sql(
+    columns: str,
+    filters: str,
+    limit: str,
+    vector: str = "q.vector",
+    storage: Optional[str] = None,
+    exact: bool = False,
+) -> str:
     """
-    Simpler version — pass texts and optional metadata dicts.
-    Each metadata dict can have: source, category, region, destination
+    SELECT `columns` from the `limit` documents nearest `vector` (by default
+    the caller's `q` row, so the vector is bound once), best first.
+    With quantized storage, over-fetches VECTOR_OVERFETCH × `limit` rows from
+    the compact index and reorders them by exact float32 cosine distance.
+    `storage` defaults to the active mode. `exact` skips the vector index and
+    ranks every row passing `filters` (see _filter_plan).
     """
-    if metadatas is None:
-        metadatas = [{} for _ in texts]
+    storage = storage or active_vector_storage()
+    if exact:
+        # OFFSET 0 keeps the subquery from being flattened, so the filter runs
+        # first (btree) and the HNSW index can't be chosen for the ORDER BY
+        return f"""
+            SELECT {columns}
+            FROM (
+                SELECT id, content, source, category, region, destination, embedding
+                FROM documents
+                WHERE 1=1 {filters}
+                OFFSET 0
+            ) AS documents
+            ORDER BY embedding <=> {vector}
+            LIMIT {limit}"""
+    if storage == "full":
+        return f"""
+            SELECT {columns}
+            FROM documents
+            WHERE 1=1 {filters}
+            ORDER BY embedding <=> {vector}
+            LIMIT {limit}"""
+    return f"""
+            SELECT {columns}
+            FROM (
+                SELECT id, content, source, category, region, destination, embedding
+                FROM documents
+                WHERE 1=1 {filters}
+                ORDER BY {_compact_distance(vector, storage)}
+                LIMIT {limit} * {VECTOR_OVERFETCH}
+            ) AS candidates
+            ORDER BY embedding <=> {vector}
+            LIMIT {limit}"""
 
-    return add_documents(
-        texts=texts,
-        sources=[m.get("source") for m in metadatas],
-        categories=[m.get("category") for m in metadatas],
-        regions=[m.get("region") for m in metadatas],
-        destinations=[m.get("destination") for m in metadatas],
+
+def _filters(params: dict, category_filter: Optional[str], region_filter: Optional[str]) -> str:
+    """SQL for the optional filters; adds their values to `params`."""
+    filters = ""
+    if category_filter:
+        filters += " AND category = %(category)s"
+        params["category"] = category_filter
+    if region_filter:
+        filters += " AND region = %(region)s"
+        params["region"] = region_filter
+    return filters
+
+
+# ── Filtered search ─────────────────────────────────────────────────────────────
+# A WHERE next to ORDER BY embedding <=> ... is applied *after* the HNSW scan,
+# which only yields hnsw.ef_search (default 40) candidates: a filter matching
+# 5% of rows keeps about 2 of them, so top_k comes back short. Filtered
+# searches are planned from cached row counts per (category, region) instead:
+#   - at most FILTER_EXACT_MAX_ROWS matching rows → exact scan of just those
+#     rows (btree on the filter columns, no HNSW): complete, and cheap at that size
+#   - pgvector >= 0.8.0 → hnsw.iterative_scan keeps scanning the graph until
+#     enough rows pass the filter
+#   - older pgvector → hnsw.ef_search raised by 1 / selectivity (capped)
+# Settings are transaction-local (set_config(..., true)), so pooled
+# connections never keep them.
+FILTER_EXACT_MAX_ROWS = int(os.getenv("FILTER_EXACT_MAX_ROWS", "2000"))
+FILTER_STATS_TTL      = float(os.getenv("FILTER_STATS_TTL", "300"))   # seconds
+HNSW_EF_SEARCH        = int(os.getenv("HNSW_EF_SEARCH", "40"))        # pgvector's default
+HNSW_EF_SEARCH_MAX    = 1000                                          # pgvector's upper bound
+ITERATIVE_SCAN_MIN_PGVECTOR = (0, 8, 0)
+
+_filter_counts: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+_filter_counts_at = 0.0   # monotonic time of the last load; 0 = stale
+
+
+def _filter_counts_due() -> bool:
+    return not _filter_counts_at or time.monotonic() - _filter_counts_at >= FILTER_STATS_TTL
+
+
+def refresh_filter_counts():
+    """Reload the row counts per (category, region) used to plan filtered searches."""
+    global _filter_counts, _filter_counts_at
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT category, region, COUNT(*) FROM documents GROUP BY category, region")
+            counts = {(category, region): n for category, region, n in cur.fetchall()}
+    _filter_counts, _filter_counts_at = counts, time.monotonic()
+
+
+def _mark_filter_counts_stale():
+    global _filter_counts_at
+    _filter_counts_at = 0.0
+
+
+on_knowledge_base_change(_mark_filter_counts_stale)
+
+
+def _filter_plan(
+    limit: int,
+    category_filter: Optional[str],
+    region_filter: Optional[str],
+) -> Tuple[bool, dict]:
+    """
+    (exact, settings) for a vector search returning `limit` rows: whether to
+    rank the filtered rows exactly, and the HNSW settings for an index scan.
+    """
+    if active_vector_storage() != "full":
+        limit *= VECTOR_OVERFETCH
+    ef_search = min(max(HNSW_EF_SEARCH, limit), HNSW_EF_SEARCH_MAX)
+    if not (category_filter or region_filter):
+        # The scan can't return more rows than ef_search
+        return False, ({"hnsw.ef_search": ef_search} if ef_search > HNSW_EF_SEARCH else {})
+
+    if _filter_counts_due():
+        refresh_filter_counts()
+    total = sum(_filter_counts.values())
+    matching = sum(
+        n for (category, region), n in _filter_counts.items()
+        if (not category_filter or category == category_filter)
+        and (not region_filter or region == region_filter)
     )
+    if matching <= FILTER_EXACT_MAX_ROWS:
+        return True, {}
+    if _pgvector_version >= ITERATIVE_SCAN_MIN_PGVECTOR:
+        return False, {"hnsw.iterative_scan": "strict_order", "hnsw.ef_search": ef_search}
+    # About ef_search × selectivity candidates survive the filter
+    ef_search = min(math.ceil(ef_search * total / matching), HNSW_EF_SEARCH_MAX)
+    return False, {"hnsw.ef_search": ef_search}
 
 
-# ── Read: Semantic search ───────────────────────────────────────────────────────
+def _settings_sql(settings: dict) -> Tuple[str, list]:
+    """One statement applying `settings` for the current transaction."""
+    sql = "SELECT " + ", ".join("set_config(%s, %s, true)" for _ in settings)
+    return sql, [str(part) for item in settings.items() for part in item]
+
+
+def _search_sql(
+    query_vector: List[float],
+    top_k: int,
+    category_filter: Optional[str] = None,
+    region_filter: Optional[str] = None,
+    storage: Optional[str] = None,
+    exact: bool = False,
+    with_embedding: bool = False,
+) -> Tuple[str, dict]:
+    """
+    Build the similarity query and its params (shared by sync and async paths).
+    `with_embedding` adds each row's embedding (for MMR).
+    """
+    params = {"vector": Vector(query_vector), "top_k": top_k}
+    filters = _filters(params, category_filter, region_filter)
+    columns = """
+                content,
+                source,
+                category,
+                region,
+                destination,
+                1 - (embedding <=> q.vector) AS similarity"""
+    if with_embedding:
+        columns += ",\n                embedding"
+    nearest = _nearest_sql(columns, filters, "%(top_k)s", storage=storage, exact=exact)
+    # The lateral's own ORDER BY doesn't order the outer query. `similarity`
+    # is the exact float32 distance, i.e. the rescored order in quantized modes.
+    sql = f"""
+        SELECT hit.*
+        FROM (SELECT %(vector)s::vector AS vector) AS q
+        CROSS JOIN LATERAL ({nearest}
+        ) AS hit
+        ORDER BY hit.similarity DESC
+    """
+    return sql, params
+
+
+def _hybrid_search_sql(
+    query: str,
+    query_vector: List[float],
+    top_k: int,
+    category_filter: Optional[str] = None,
+    region_filter: Optional[str] = None,
+    exact: bool = False,
+    with_embedding: bool = False,
+) -> Tuple[str, dict]:
+    """
+    Vector and full-text legs fused by reciprocal rank in one statement:
+    score = 1/(k + vector_rank) + 1/(k + text_rank). The query vector is bound
+    once, in the `query_vector` CTE. `with_embedding` adds each row's
+    embedding and fused score (for MMR).
+    """
+    params = {
+        "vector":     Vector(query_vector),
+        "query":      query,
+        "candidates": max(HYBRID_CANDIDATES, top_k),
+        "rrf_k":      RRF_K,
+        "top_k":      top_k,
+    }
+    filters = _filters(params, category_filter, region_filter)
+    nearest = _nearest_sql("id, embedding <=> q.vector AS distance", filters, "%(candidates)s", exact=exact)
+    extra = ",\n            d.embedding,\n            fused.score" if with_embedding else ""
+
+    # plainto_tsquery ANDs every word, which a full question rarely satisfies;
+    # OR-ing them lets ts_rank_cd reward documents matching the most terms.
+    sql = f"""
+        WITH query_vector AS (
+            SELECT %(vector)s::vector AS vector
+        ),
+        terms AS (
+            SELECT replace(plainto_tsquery('english', %(query)s)::text, '&', '|')::tsquery AS q
+        ),
+        semantic AS (
+            SELECT id, RANK() OVER (ORDER BY distance) AS rank
+            FROM query_vector AS q
+            CROSS JOIN LATERAL ({nearest}
+            ) AS nearest
+        ),
+        lexical AS (
+            SELECT id, RANK() OVER (ORDER BY ts_rank_cd(search_tsv, q) DESC) AS rank
+            FROM documents, terms
+            WHERE search_tsv @@ q {filters}
+            ORDER BY ts_rank_cd(search_tsv, q) DESC
+            LIMIT %(candidates)s
+        ),
+        fused AS (
+            SELECT
+                COALESCE(semantic.id, lexical.id) AS id,
+                COALESCE(1.0 / (%(rrf_k)s + semantic.rank), 0.0) +
+                COALESCE(1.0 / (%(rrf_k)s + lexical.rank), 0.0) AS score
+            FROM semantic
+            FULL OUTER JOIN lexical ON semantic.id = lexical.id
+            ORDER BY score DESC
+            LIMIT %(top_k)s
+        )
+        SELECT
+            d.content,
+            d.source,
+            d.category,
+            d.region,
+            d.destination,
+            1 - (d.embedding <=> q.vector) AS similarity{extra}
+        FROM fused
+        JOIN documents d ON d.id = fused.id
+        CROSS JOIN query_vector AS q
+        ORDER BY fused.score DESC
+    """
+    return sql, params
+
+
+def _build_search(
+    query: str,
+    query_vector: List[float],
+    top_k: int,
+    category_filter: Optional[str],
+    region_filter: Optional[str],
+    with_embedding: bool = False,
+) -> Tuple[str, dict, dict]:
+    """(sql, params, settings) for one search; settings are applied first."""
+    if use_hybrid_search():
+        exact, settings = _filter_plan(max(HYBRID_CANDIDATES, top_k), category_filter, region_filter)
+        sql, params = _hybrid_search_sql(
+            query, query_vector, top_k, category_filter, region_filter, exact, with_embedding,
+        )
+    else:
+        exact, settings = _filter_plan(top_k, category_filter, region_filter)
+        sql, params = _search_sql(
+            query_vector, top_k, category_filter, region_filter, exact=exact, with_embedding=with_embedding,
+        )
+    return sql, params, settings
+
+
+# ── Diversification (MMR) ───────────────────────────────────────────────────────
+# Many chunks restate the same facts (several Masai Mara and Amboseli entries),
+# so the plain top_k often spends the prompt on repeats. With MMR_ENABLED,
+# similarity_search fetches MMR_CANDIDATES rows with their embeddings and keeps
+# the top_k chosen by maximal marginal relevance (see mmr.py). MMR_LAMBDA=1
+# keeps relevance order; lower values favor diversity.
+MMR_ENABLED    = os.getenv("MMR_ENABLED", "false").lower() == "true"
+MMR_LAMBDA     = float(os.getenv("MMR_LAMBDA", "0.7"))
+MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))
+
+
+def _diversify(rows: List[dict], query_vector: List[float], top_k: int) -> List[dict]:
+    """
+    MMR-select `top_k` of `rows` (which carry "embedding", and "score" from
+    hybrid search) and strip those keys. Hybrid rows are ranked by fused score
+    scaled to [0, 1], so full-text hits keep their weight; others by cosine.
+    """
+    if not rows:
+        return rows
+    vectors = np.stack([_embedding_array(row.pop("embedding")) for row in rows])
+    relevance = None
+    if "score" in rows[0]:
+        scores = np.array([float(row.pop("score")) for row in rows], dtype=np.float32)
+        relevance = scores / scores.max()
+    picked = mmr_select(query_vector, vectors, top_k, MMR_LAMBDA, relevance)
+    return [rows[i] for i in picked]
+
 
 def similarity_search(
     query: str,
     top_k: int = 5,
     category_filter: Optional[str] = None,
     region_filter: Optional[str] = None,
+    query_vector: Optional[List[float]] = None,
+    diversify: Optional[bool] = None,
 ) -> List[dict]:
     """
-    Find the top_k most semantically similar documents to the query.
-    Optionally filter by category or region.
+    Find the top_k most relevant documents to the query: by embedding and
+    full-text rank fused together (SEARCH_MODE=hybrid), or by embedding alone.
+    Optionally filter by category or region. Pass `query_vector` to skip
+    embedding when the caller already has it. `diversify` (default
+    MMR_ENABLED) re-ranks a larger candidate pool by MMR.
 
     Returns list of dicts: {content, source, category, region, destination, similarity}
     """
-    query_vector = embedder.embed_query(query)
-    query_vector_str = str(query_vector)
+    if query_vector is None:
+        query_vector = embedder.embed_query(query)
+    diversify = MMR_ENABLED if diversify is None else diversify
+    limit = max(MMR_CANDIDATES, top_k) if diversify else top_k
 
-    # Build filter conditions - params must match order of %s in SQL
-    filters = []
-    filter_params = []
-    if category_filter:
-        filters.append("AND category = %s")
-        filter_params.append(category_filter)
-    if region_filter:
-        filters.append("AND region = %s")
-        filter_params.append(region_filter)
+    if use_memory_index():
+        memory_index.refresh()
+        results = memory_index.search(query_vector, limit, category_filter, region_filter, diversify)
+        return _diversify(results, query_vector, top_k) if diversify else results
+
+    ensure_schema()
+    sql, params, settings = _build_search(query, query_vector, limit, category_filter, region_filter, diversify)
+
+    with pool.connection() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            if settings:
+                cur.execute(*_settings_sql(settings))
+            cur.execute(sql, params)
+            results = [dict(r) for r in cur.fetchall()]
+    return _diversify(results, query_vector, top_k) if diversify else results
+
+
+async def similarity_search_async(
+    query: str,
+    top_k: int = 5,
+    category_filter: Optional[str] = None,
+    region_filter: Optional[str] = None,
+    query_vector: Optional[List[float]] = None,
+    diversify: Optional[bool] = None,
+) -> List[dict]:
+    """Async version of similarity_search (used by the /chat request path)."""
+    if query_vector is None:
+        query_vector = await embedder.embed_query_async(query)
+    diversify = MMR_ENABLED if diversify is None else diversify
+    limit = max(MMR_CANDIDATES, top_k) if diversify else top_k
 
-    # Order: similarity %s, filter %s(s), ORDER BY %s, LIMIT %s
-    params = [query_vector_str] + filter_params + [query_vector_str, top_k]
+    if use_memory_index():
+        if memory_index.refresh_due():
+            await asyncio.to_thread(memory_index.refresh)
+        results = memory_index.search(query_vector, limit, category_filter, region_filter, diversify)
+        return _diversify(results, query_vector, top_k) if diversify else results
+
+    if _schema_due():
+        await asyncio.to_thread(ensure_schema)
+    if (category_filter or region_filter) and _filter_counts_due():
+        await asyncio.to_thread(refresh_filter_counts)
+    sql, params, settings = _build_search(query, query_vector, limit, category_filter, region_filter, diversify)
+
+    async with (await open_async_pool()).connection() as conn:
+        if settings:
+            await conn.execute(*_settings_sql(settings))
+        # Binary results bring embeddings back as float4s, not decimal text
+        cur = await conn.execute(sql, params, binary=diversify)
+        results = await cur.fetchall()
+    return _diversify(results, query_vector, top_k) if diversify else results
+
+
+# ── Batch search (retrieval only, /search) ──────────────────────────────────────
+
+def _batch_search_sql(
+    query_vectors: List[List[float]],
+    top_k: int,
+    category_filter: Optional[str] = None,
+    region_filter: Optional[str] = None,
+    exact: bool = False,
+) -> Tuple[str, dict]:
+    """
+    Top-k for every query vector in one statement: the vectors are unnested
+    with their position and each drives its own index scan via LATERAL.
+    """
+    params = {"vectors": [Vector(v) for v in query_vectors], "top_k": top_k}
+    filters = _filters(params, category_filter, region_filter)
+    columns = """
+                content,
+                source,
+                category,
+                region,
+                destination,
+                1 - (embedding <=> q.vector) AS similarity"""
+    nearest = _nearest_sql(columns, filters, "%(top_k)s", exact=exact)
 
     sql = f"""
-        SELECT
-            content,
-            source,
-            category,
-            region,
-            destination,
-            1 - (embedding <=> %s::vector) AS similarity
-        FROM documents
-        WHERE 1=1
-        {" ".join(filters)}
-        ORDER BY embedding <=> %s::vector
-        LIMIT %s
+        SELECT q.ord - 1 AS query_index, hit.*
+        FROM unnest(%(vectors)s::vector[]) WITH ORDINALITY AS q(vector, ord)
+        CROSS JOIN LATERAL ({nearest}
+        ) AS hit
+        ORDER BY q.ord, hit.similarity DESC
     """
+    return sql, params
 
-    conn = get_connection()
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute(sql, params)
-            results = cur.fetchall()
-        return [dict(r) for r in results]
-    finally:
-        conn.close()
+
+async def batch_similarity_search_async(
+    queries: List[str],
+    top_k: int = 5,
+    category_filter: Optional[str] = None,
+    region_filter: Optional[str] = None,
+    query_vectors: Optional[List[List[float]]] = None,
+) -> List[List[dict]]:
+    """
+    Vector top-k for many queries: one batched embed call and one DB round
+    trip (or one matrix product against the in-memory index). Ranked by
+    embedding similarity alone, whatever SEARCH_MODE is, so scores are
+    comparable across queries. Returns one result list per query, in order.
+    """
+    if not queries:
+        return []
+    if query_vectors is None:
+        query_vectors = await embedder.embed_query_batch_async(queries)
+
+    if use_memory_index():
+        if memory_index.refresh_due():
+            await asyncio.to_thread(memory_index.refresh)
+        return memory_index.search_many(query_vectors, top_k, category_filter, region_filter)
+
+    if _schema_due():
+        await asyncio.to_thread(ensure_schema)
+    if (category_filter or region_filter) and _filter_counts_due():
+        await asyncio.to_thread(refresh_filter_counts)
+    exact, settings = _filter_plan(top_k, category_filter, region_filter)
+    sql, params = _batch_search_sql(query_vectors, top_k, category_filter, region_filter, exact)
+    async with (await open_async_pool()).connection() as conn:
+        if settings:
+            await conn.execute(*_settings_sql(settings))
+        cur = await conn.execute(sql, params)
+        rows = await cur.fetchall()
+
+    results = [[] for _ in queries]
+    for row in rows:
+        results[row.pop("query_index")].append(row)
+    return results
 
 
 # ── Chat history ────────────────────────────────────────────────────────────────
 
+# By default messages are written behind the response: save_message only
+# buffers them and a background thread inserts them in batches. Reads merge
+# in anything not yet flushed, so a session always sees its own last turn.
+HISTORY_WRITE_BEHIND = os.getenv("HISTORY_WRITE_BEHIND", "true").lower() == "true"
+
+history_writer = HistoryWriter(
+    pool,
+    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "50")) / 1000,
+    max_backlog=int(os.getenv("HISTORY_MAX_BACKLOG", "10000")),
+    enqueue_timeout=float(os.getenv("HISTORY_ENQUEUE_TIMEOUT", "5")),
+)
+
+# Recent turns of active sessions are also kept in memory (write-through), so
+# a follow-up turn reads its history without touching Postgres. Assumes one
+# app process owns a session; HISTORY_CACHE_TTL bounds staleness otherwise.
+HISTORY_CACHE_ENABLED = os.getenv("HISTORY_CACHE_ENABLED", "true").lower() == "true"
+
+history_cache = SessionHistoryCache(
+    max_sessions=int(os.getenv("HISTORY_CACHE_SESSIONS", "1000")),
+    capacity=int(os.getenv("HISTORY_CACHE_MESSAGES", "20")),
+    ttl=float(os.getenv("HISTORY_CACHE_TTL", "1800")),
+)
+
+INSERT_MESSAGE_SQL = "INSERT INTO chat_sessions (session_id, role, content) VALUES (%s, %s, %s)"
+
+# id breaks ties between rows sharing a timestamp
+SELECT_HISTORY_SQL = """
+    SELECT role, content, created_at FROM chat_sessions
+    WHERE session_id = %s
+    ORDER BY created_at DESC, id DESC
+    LIMIT %s
+"""
+
+
+def _merge_pending(rows: List[dict], pending: List[dict], limit: int) -> List[dict]:
+    """
+    Combine stored rows (newest first) with unflushed messages, oldest first.
+    `pending` is snapshotted before the query, so a batch committed in between
+    can show up in both — enqueue timestamps are unique, so drop those.
+    """
+    rows = list(reversed(rows))
+    if pending:
+        stored = {r["created_at"] for r in rows}
+        rows += [p for p in pending if p["created_at"] not in stored]
+        # Another worker process may have committed newer rows for this session
+        rows = sorted(rows, key=lambda r: r["created_at"])[-limit:]
+    return [{"role": r["role"], "content": r["content"]} for r in rows]
+
+
+def _cached_history(session_id: str, limit: int) -> Tuple[Optional[List[dict]], int, int]:
+    """(cached messages or None, load token, rows to fetch on a miss)."""
+    if not HISTORY_CACHE_ENABLED:
+        return None, 0, limit
+    # Fetch a full ring buffer on a miss so later turns can be served from memory
+    return history_cache.get(session_id, limit), history_cache.begin_load(), max(limit, history_cache.capacity)
+
+
+def _cache_loaded(session_id: str, history: List[dict], token: int, limit: int) -> List[dict]:
+    if HISTORY_CACHE_ENABLED:
+        history_cache.load(session_id, history, token)
+    return history[-limit:] if limit > 0 else []
+
+
+def _storable(content: str) -> str:
+    # PostgreSQL text can't hold NUL characters (valid in JSON, rejected by the driver)
+    return content.replace("\x00", "")
+
+
 def save_message(session_id: str, role: str, content: str):
-    """Save a chat message to history."""
-    conn = get_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO chat_sessions (session_id, role, content) VALUES (%s, %s, %s)",
-                (session_id, role, content)
-            )
-        conn.commit()
-    finally:
-        conn.close()
+    """Save a chat message to history (buffered when write-behind is on)."""
+    content = _storable(content)
+    if HISTORY_WRITE_BEHIND:
+        history_writer.enqueue(session_id, role, content)
+    else:
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(INSERT_MESSAGE_SQL, (session_id, role, content))
+            conn.commit()
+    if HISTORY_CACHE_ENABLED:
+        history_cache.append(session_id, role, content)
 
 
 def get_history(session_id: str, limit: int = 10) -> List[dict]:
-    """Retrieve recent chat history for a session."""
-    conn = get_connection()
-    try:
+    """Retrieve recent chat history for a session, oldest message first."""
+    cached, token, fetch = _cached_history(session_id, limit)
+    if cached is not None:
+        return cached
+    pending = history_writer.pending(session_id) if HISTORY_WRITE_BEHIND else []
+    with pool.connection() as conn:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT role, content FROM chat_sessions
-                WHERE session_id = %s
-                ORDER BY created_at DESC
-                LIMIT %s
-                """,
-                (session_id, limit)
-            )
+            cur.execute(SELECT_HISTORY_SQL, (session_id, fetch))
             rows = cur.fetchall()
-        # Reverse so oldest message is first
-        return [dict(r) for r in reversed(rows)]
-    finally:
-        conn.close()
+    return _cache_loaded(session_id, _merge_pending(rows, pending, fetch), token, limit)
+
+
+async def save_message_async(session_id: str, role: str, content: str):
+    """Async version of save_message. The pool commits when the block exits."""
+    content = _storable(content)
+    if HISTORY_WRITE_BEHIND:
+        if not history_writer.try_enqueue(session_id, role, content):
+            # Backlog full: wait for room off the event loop (backpressure)
+            await asyncio.to_thread(history_writer.enqueue, session_id, role, content)
+    else:
+        async with (await open_async_pool()).connection() as conn:
+            await conn.execute(INSERT_MESSAGE_SQL, (session_id, role, content))
+    if HISTORY_CACHE_ENABLED:
+        history_cache.append(session_id, role, content)
+
+
+async def get_history_async(session_id: str, limit: int = 10) -> List[dict]:
+    """Async version of get_history."""
+    cached, token, fetch = _cached_history(session_id, limit)
+    if cached is not None:
+        return cached
+    pending = history_writer.pending(session_id) if HISTORY_WRITE_BEHIND else []
+    async with (await open_async_pool()).connection() as conn:
+        cur = await conn.execute(SELECT_HISTORY_SQL, (session_id, fetch))
+        rows = await cur.fetchall()
+    return _cache_loaded(session_id, _merge_pending(rows, pending, fetch), token, limit)
+
+
+def get_history_cache_stats() -> dict:
+    """Session history cache hit rate (exposed on /health)."""
+    return history_cache.stats() if HISTORY_CACHE_ENABLED else {}
+
+
+def get_history_writer_stats() -> dict:
+    """Write-behind backlog and batch sizes (exposed on /health)."""
+    return history_writer.stats() if HISTORY_WRITE_BEHIND else {}
 
 
 # ── Utility ─────────────────────────────────────────────────────────────────────
 
 def get_document_count() -> int:
     """How many documents are in the knowledge base."""
-    conn = get_connection()
-    try:
+    with pool.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("SELECT COUNT(*) FROM documents")
             return cur.fetchone()[0]
-    finally:
-        conn.close()
+
+
+def delete_documents_by_source(sources: List[str]) -> int:
+    """Delete every document whose source is in `sources` (e.g. re-scraped pages)."""
+    if not sources:
+        return 0
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM documents WHERE source = ANY(%s)", (list(sources),))
+            deleted = cur.rowcount
+        conn.commit()
+
+    if deleted:
+        _notify_change()
+    return deleted
 
 
 def clear_knowledge_base():
     """Delete all documents. Use with care."""
-    conn = get_connection()
-    try:
+    with pool.connection() as conn:
         with conn.cursor() as cur:
             cur.execute("TRUNCATE TABLE documents RESTART IDENTITY")
         conn.commit()
         print("Knowledge base cleared.")
-    finally:
-        conn.close()
+
+    _notify_change()
 
 
 # ── Quick test ──────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="pgvector store check / migrations.")
+    parser.add_argument("--migrate", action="store_true",
+                        help="apply pending schema migrations (columns, indexes) and exit")
+    parser.add_argument("--migrate-storage", choices=list(VECTOR_INDEXES), metavar="MODE",
+                        help="build the HNSW index for a VECTOR_STORAGE mode (full, halfvec, binary)")
+    parser.add_argument("--drop-unused", action="store_true",
+                        help="with --migrate-storage: drop the other vector indexes")
+    args = parser.parse_args()
+
+    if args.migrate:
+        migrate_schema()
+        print(f"Schema up to date ({len(_schema_columns)} columns, {len(_schema_indexes)} indexes)")
+        raise SystemExit(0)
+
+    if args.migrate_storage:
+        migrate_schema()
+        print(migrate_vector_storage(args.migrate_storage, drop_unused=args.drop_unused))
+        raise SystemExit(0)
+
     # Add sample documents
     sample_texts = [
         "Masai Mara National Reserve is Kenya's most famous safari destination. Entry fee: $70 USD per adult per day.",